@@ -1,7 +1,12 @@
 import logging
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from django.db import transaction
-from .models import Order
+from .changelist import EstimatedCountPaginator, OrderChangeList
+from .models import Order, NotifyOutbox
+from .outbox import requeue
+from . import search
+from .services import bulk_transition_status
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +26,9 @@ class OrderAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at", "updated_at", "consent_ts")
     autocomplete_fields = ()
     list_per_page = 50
+    # оценка числа строк и keyset-страницы вместо COUNT(*) и OFFSET (см. core/changelist.py)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         ("Клиент", {
@@ -47,19 +55,35 @@ class OrderAdmin(admin.ModelAdmin):
         "mark_out_for_delivery", "mark_delivered", "mark_canceled",
     ]
 
+    def get_changelist(self, request, **kwargs):
+        return OrderChangeList
+
+    # ==== Поиск: tsvector + телефон по цифрам (core/search.py) ====
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term or not search.supported(queryset):
+            return super().get_search_results(request, queryset, search_term)
+        qs = search.search_orders(queryset, term)
+        # сначала самые релевантные; клик по колонке (?o=) оставляет её сортировку
+        if search.RANK in qs.query.annotations and ORDER_VAR not in request.GET:
+            qs = qs.order_by(f"-{search.RANK}", "-created_at", "-pk")
+        return qs, False
+
     # ВАЖНО: не рассылаем уведомления из админки — это делает сигнал.
     def save_model(self, request, obj, form, change):
-        super().save_model(request, obj, form, change)
+        # changeform_view и так в транзакции; явно — чтобы save и очередь из post_save
+        # не разъехались, если сохранение вызовут в обход формы
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
 
     # ==== Массовые действия ====
     def _bulk_status_change(self, request, qs, new_status):
-        # Без своих уведомлений; сигнал сам отправит после фиксации транзакции.
-        for obj in qs:
-            old = obj.status
-            if old == new_status:
-                continue
-            obj.status = new_status
-            obj.save(update_fields=["status"])
+        # Один UPDATE на всю выборку; уведомления встают в очередь одной пачкой.
+        result = bulk_transition_status(qs, new_status)
+        self.message_user(
+            request,
+            f"Статус изменён: {result.changed}, уведомлений в очереди: {result.enqueued}",
+        )
 
     @admin.action(description="Статус → Подтверждён")
     def mark_confirmed(self, request, qs):
@@ -84,3 +108,18 @@ class OrderAdmin(admin.ModelAdmin):
     @admin.action(description="Статус → Отменён")
     def mark_canceled(self, request, qs):
         self._bulk_status_change(request, qs, Order.Status.CANCELED)
+
+
+@admin.register(NotifyOutbox)
+class NotifyOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "created_at", "kind", "key", "state", "attempts", "next_attempt_at")
+    list_filter = ("state", "kind")
+    search_fields = ("key",)
+    readonly_fields = ("key", "kind", "payload", "attempts", "last_error", "created_at", "updated_at")
+    list_per_page = 50
+    actions = ["requeue_selected"]
+
+    @admin.action(description="Отправить повторно")
+    def requeue_selected(self, request, qs):
+        n = requeue(qs)
+        self.message_user(request, f"Возвращено в очередь: {n}")
@@ -8,5 +8,8 @@ class CoreConfig(AppConfig):
     name = "core"
 
     def ready(self):
-        log.warning("CoreConfig.ready() called")
+        log.debug("CoreConfig.ready() called")
         from . import signals  # noqa
+        from django.db.backends.signals import connection_created
+        from .perf import install_db_wrapper
+        connection_created.connect(install_db_wrapper, dispatch_uid="core.perf.db_wrapper")
@@ -0,0 +1,76 @@
+"""
+Двухуровневый кэш: L1 — память процесса, L2 — общий бэкенд (DatabaseCache).
+Чтения и повторные add() по «горячим» ключам не ходят в БД.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._local_alias = options.get("LOCAL", "local")
+        self._shared_alias = options.get("SHARED", "shared")
+        # L1 живёт недолго: чужие процессы могли удалить/перезаписать ключ в L2
+        self._local_timeout = options.get("LOCAL_TIMEOUT", 30)
+
+    @property
+    def local(self) -> BaseCache:
+        return caches[self._local_alias]
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self._shared_alias]
+
+    def _local_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.local.get(key, version=version) is not None:
+            return False
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self.local.set(key, value, self._local_ttl(timeout), version=version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value = self.local.get(key, sentinel, version=version)
+        if value is not sentinel:
+            return value
+        value = self.shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            return default
+        self.local.set(key, value, self._local_ttl(DEFAULT_TIMEOUT), version=version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self.local.set(key, value, self._local_ttl(timeout), version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self.local.delete(key, version=version)
+        return self.shared.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        return self.local.has_key(key, version=version) or self.shared.has_key(key, version=version)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
@@ -0,0 +1,177 @@
+"""
+Critical CSS для base.html.
+
+Bootstrap и иконки грузятся с CDN и блокируют первую отрисовку. Команда
+build_critical_css рендерит страницы каждого семейства шаблонов (landing, hub,
+order), собирает использованные теги/классы/id и оставляет из CDN-стилей только
+подходящие правила — они инлайнятся в <head>, а полные файлы грузятся
+асинхронно. Нет файла для семейства — обычные блокирующие <link>.
+"""
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+
+from django.conf import settings
+
+# Внешние стили из base.html — в том порядке, в каком они подключаются
+STYLESHEETS = [
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+    "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.css",
+    "https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700;800&display=swap",
+]
+# Из чего critical CSS вырезается (шрифты Google отдают @font-face под конкретный UA)
+CRITICAL_SOURCES = STYLESHEETS[:2]
+FAMILIES = ("landing", "hub", "order")
+
+# Селекторы, которые нужны всегда (переменные, сброс, типографика)
+_ALWAYS = {"*", ":root", "html", "body"}
+_PSEUDO = re.compile(r"::?[\w-]+(\((?:[^()]|\([^()]*\))*\))?")
+_ATTR = re.compile(r"\[[^\]]*\]")
+_TOKEN = re.compile(r"([.#]?)(-?[_a-zA-Z][\w-]*)")
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_URL = re.compile(r"""url\(\s*(['"]?)(?!data:|https?:|//|/)([^'")]+)\1\s*\)""")
+# @-правила, в которые заходим рекурсивно; остальные (@keyframes, @page...) выкидываем
+_NESTED_AT = ("@media", "@supports", "@layer", "@container")
+
+
+def _cache_dir() -> Path:
+    return Path(getattr(settings, "CRITICAL_CSS_DIR", Path(settings.BASE_DIR) / "core" / "critical"))
+
+
+@lru_cache(maxsize=None)
+def critical_css(family: str) -> Optional[str]:
+    """Готовый critical CSS семейства или None, если команда ещё не запускалась."""
+    try:
+        return (_cache_dir() / f"{family}.css").read_text("utf-8")
+    except OSError:
+        return None
+
+
+# ---------- разбор HTML ----------
+
+class _TokenCollector(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.tags: Set[str] = set()
+        self.classes: Set[str] = set()
+        self.ids: Set[str] = set()
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.add(tag)
+        for name, value in attrs:
+            if name == "class" and value:
+                self.classes.update(value.split())
+            elif name == "id" and value:
+                self.ids.add(value)
+
+
+def used_tokens(html: str) -> Tuple[Set[str], Set[str], Set[str]]:
+    """(теги, классы, id), встречающиеся в разметке."""
+    parser = _TokenCollector()
+    parser.feed(html)
+    parser.close()
+    return parser.tags, parser.classes, parser.ids
+
+
+# ---------- разбор CSS ----------
+
+def _strip_comments(text: str) -> str:
+    return _COMMENT.sub("", text).strip()
+
+
+def _blocks(css: str) -> Iterator[Tuple[str, str]]:
+    """(прелюдия, тело) верхнего уровня; учитывает вложенные скобки, строки и комментарии."""
+    i, n = 0, len(css)
+    start = 0
+    while i < n:
+        ch = css[i]
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if ch in "\"'":
+            end = i + 1
+            while end < n and css[end] != ch:
+                end += 2 if css[end] == "\\" else 1
+            i = end + 1
+            continue
+        if ch == ";" and _strip_comments(css[start:i]).startswith("@"):
+            # @charset/@import без тела
+            start = i + 1
+        elif ch == "{":
+            depth, j = 1, i + 1
+            while j < n and depth:
+                c = css[j]
+                if c in "\"'":
+                    k = j + 1
+                    while k < n and css[k] != c:
+                        k += 2 if css[k] == "\\" else 1
+                    j = k
+                elif c == "{":
+                    depth += 1
+                elif c == "}":
+                    depth -= 1
+                j += 1
+            prelude = _strip_comments(css[start:i])
+            yield prelude, css[i + 1:j - 1]
+            i = start = j
+            continue
+        i += 1
+
+
+def _split_selectors(prelude: str) -> List[str]:
+    """Список селекторов по запятым верхнего уровня (не внутри :not(...)/:is(...))."""
+    parts, depth, start = [], 0, 0
+    for i, ch in enumerate(prelude):
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == "," and not depth:
+            parts.append(prelude[start:i].strip())
+            start = i + 1
+    parts.append(prelude[start:].strip())
+    return parts
+
+
+def _selector_used(selector: str, tags, classes, ids) -> bool:
+    selector = _ATTR.sub("", _PSEUDO.sub("", selector)).strip()
+    if not selector or selector in _ALWAYS:
+        return True
+    for part in re.split(r"[\s>+~]+", selector):
+        for prefix, name in _TOKEN.findall(part):
+            if prefix == "." and name not in classes:
+                return False
+            if prefix == "#" and name not in ids:
+                return False
+            if not prefix and name.lower() not in tags and name not in _ALWAYS:
+                return False
+    return True
+
+
+def extract(css: str, tokens, base_url: str = "") -> str:
+    """Правила из css, чьи селекторы могут сработать на странице с данными токенами."""
+    tags, classes, ids = tokens
+    out: List[str] = []
+    for prelude, body in _blocks(css):
+        if prelude.startswith("@"):
+            if prelude.startswith("@media print"):
+                continue
+            if prelude.startswith("@font-face"):
+                out.append(f"{prelude}{{{body.strip()}}}")
+            elif prelude.startswith(_NESTED_AT):
+                inner = extract(body, tokens, base_url)
+                if inner:
+                    out.append(f"{prelude}{{{inner}}}")
+            continue
+        kept = [s for s in _split_selectors(prelude) if _selector_used(s, tags, classes, ids)]
+        if kept:
+            out.append(f"{','.join(kept)}{{{body.strip()}}}")
+    result = "".join(out)
+    if base_url:
+        # относительные url(...) (шрифты иконок) считаются от исходного файла, а не от страницы
+        result = _URL.sub(lambda m: f"url({m.group(1)}{urljoin(base_url, m.group(2))}{m.group(1)})", result)
+    return result
@@ -0,0 +1,122 @@
+"""
+Хаб-страницы /aero/<code>/ и /station/<code>/.
+
+Данные статичны (AEROPORTS/STATIONS), поэтому SEO-строки и перелинковка
+считаются один раз на процесс, а готовый HTML хранится в памяти процесса
+по ключу «версия деплоя + схема + хост + путь» и отдаётся с ETag/304.
+В память попадают только запросы к каноническому хосту (SITE_URL): хост берётся
+из заголовка, и поддомены вроде *.railway.app иначе раздували бы словарь без предела.
+"""
+import hashlib
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import render
+from django.urls import reverse
+
+from .pagecache import conditional_page, deploy_version, page_key
+from .stations import AEROPORTS, STATIONS
+
+HUBS = {
+    "aero": AEROPORTS,
+    "station": STATIONS,
+}
+
+# page_key -> (html, etag)
+_rendered: Dict[str, Tuple[bytes, str]] = {}
+
+
+def _aero_seo(data) -> dict:
+    desc = (
+        f"Заберём у двери, упакуем и опечатаем, оформим акт и доставим {data['name_prep']} "
+        f"или {data['name_gen']} — точно ко времени. Первые сутки хранения включены."
+    )
+    return {
+        "h1": f"Доставка багажа {data['name_prep']} и {data['name_gen']} — Drop & Delivery",
+        "meta_title": f"Доставка багажа {data['name_prep']} / {data['name_gen']} — Drop & Delivery",
+        "meta_desc": desc,
+    }
+
+
+def _station_seo(data) -> dict:
+    desc = (
+        f"Заберём багаж у двери и доставим {data['name_prep']} или заберём {data['name_gen']} "
+        f"и привезём по адресу. Пломба, фотофиксация, акт, 1 ночь хранения включена."
+    )
+    return {
+        "h1": f"Доставка багажа {data['name_prep']} — Drop & Delivery",
+        "meta_title": f"Доставка багажа {data['name_prep']} / {data['name_gen']} — Drop & Delivery",
+        "meta_desc": desc,
+    }
+
+
+def _nav_items(kind: str, code: str):
+    # Перелинковка: аэропорт → другие аэропорты + несколько вокзалов,
+    # вокзал → другие вокзалы + все аэропорты
+    if kind == "aero":
+        items = [(reverse("aero", args=[k]), f"Аэропорт: {v['title']}") for k, v in AEROPORTS.items() if k != code]
+        items += [(reverse("station", args=[k]), f"Вокзал: {v['title']}") for k, v in list(STATIONS.items())[:6]]
+    else:
+        items = [(reverse("station", args=[k]), f"Вокзал: {v['title']}") for k, v in STATIONS.items() if k != code]
+        items += [(reverse("aero", args=[k]), f"Аэропорт: {v['title']}") for k, v in AEROPORTS.items()]
+    return items
+
+
+@lru_cache(maxsize=None)
+def hub_context(kind: str, code: str) -> Optional[dict]:
+    """Контекст хаба без canonical (он зависит от хоста запроса); None — нет такого кода."""
+    data = HUBS[kind].get(code)
+    if not data:
+        return None
+    seo = _aero_seo(data) if kind == "aero" else _station_seo(data)
+    return {
+        "code": code,
+        "data": data,
+        "path": reverse(kind, args=[code]),
+        "nav_items": _nav_items(kind, code),
+        **seo,
+    }
+
+
+def warm():
+    """Посчитать контексты всех хабов заранее (например, при старте воркера)."""
+    for kind, items in HUBS.items():
+        for code in items:
+            hub_context(kind, code)
+
+
+@lru_cache(maxsize=1)
+def _canonical_host() -> str:
+    return urlsplit(getattr(settings, "SITE_URL", "")).netloc.lower()
+
+
+def render_hub(request, kind: str, code: str):
+    ctx = hub_context(kind, code.lower())
+    if ctx is None:
+        raise Http404("Station not found") if kind == "station" else Http404()
+
+    # кэшируем только канонический хост и путь: вариации регистра (/aero/SVO/) и чужие хосты
+    # рендерим как есть, чтобы не раздувать кэш
+    if (
+        settings.DEBUG
+        or request.method not in ("GET", "HEAD")
+        or request.path != ctx["path"]
+        or request.get_host().lower() != _canonical_host()
+    ):
+        return render(request, "core/hub.html", {**ctx, "canonical": request.build_absolute_uri(ctx["path"])})
+
+    key = page_key(request, prefix=f"hub:{kind}")
+    entry = _rendered.get(key)
+    if entry is None:
+        response = render(
+            request, "core/hub.html", {**ctx, "canonical": request.build_absolute_uri(ctx["path"])}
+        )
+        content = response.content
+        entry = (content, '"%s"' % hashlib.md5(content).hexdigest())
+        _rendered[key] = entry
+
+    content, etag = entry
+    return conditional_page(request, content, "text/html; charset=utf-8", etag, deploy_version()[1])
@@ -0,0 +1,184 @@
+"""
+Логирование без блокировок: QueueHandler в горячем пути, запись в stdout — в
+отдельном потоке QueueListener. Строки — JSON (LOG_FORMAT=json) или обычный
+текст для локальной разработки.
+
+К каждой записи добавляются request_id (RequestIdMiddleware) и order_id
+(bind(order_id=...)) — по ним склеиваются запрос, сигналы и отправки воркера.
+Большие payload'ы логируем через truncate() и только на DEBUG с выборкой sampled().
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_request_id: ContextVar[Optional[str]] = ContextVar("log_request_id", default=None)
+_order_id: ContextVar[Optional[str]] = ContextVar("log_order_id", default=None)
+
+_REQUEST_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+_ORDER_KEY_RE = re.compile(r"order:(\d+)")
+
+# атрибуты LogRecord, которые не надо дублировать в JSON как extra
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+# ---------- корреляция ----------
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """ID из заголовка X-Request-ID (если он вменяемый) или новый."""
+    if incoming and _REQUEST_ID_RE.match(incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+def bind_request(request_id: str):
+    return _request_id.set(request_id)
+
+
+def unbind_request(token):
+    _request_id.reset(token)
+
+
+@contextmanager
+def bind(order_id=None, key: str = ""):
+    """Привязать order_id к записям внутри блока; можно передать ключ очереди вида notify:order:<pk>:..."""
+    if order_id is None and key:
+        m = _ORDER_KEY_RE.search(key)
+        order_id = m.group(1) if m else None
+    if order_id is None:
+        yield
+        return
+    token = _order_id.set(str(order_id))
+    try:
+        yield
+    finally:
+        _order_id.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Снимает request_id/order_id в потоке, который пишет запись (до очереди)."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        record.order_id = _order_id.get()
+        return True
+
+
+# ---------- payload ----------
+
+def truncate(value, limit: Optional[int] = None) -> str:
+    from django.conf import settings
+
+    limit = limit or getattr(settings, "LOG_PAYLOAD_MAX_CHARS", 2000)
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    if len(text) > limit:
+        return f"{text[:limit]}…(+{len(text) - limit} chars)"
+    return text
+
+
+def sampled() -> bool:
+    from django.conf import settings
+
+    rate = getattr(settings, "LOG_PAYLOAD_SAMPLE_RATE", 0.0)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+# ---------- форматирование ----------
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in ("request_id", "order_id"):
+            if getattr(record, name, None):
+                data[name] = getattr(record, name)
+        for name, value in vars(record).items():
+            if name not in _RESERVED and name not in data and name not in ("request_id", "order_id"):
+                data[name] = value if isinstance(value, (int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s %(order_id)s] %(message)s")
+
+    def format(self, record):
+        record.request_id = getattr(record, "request_id", None) or "-"
+        record.order_id = getattr(record, "order_id", None) or "-"
+        return super().format(record)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # В отличие от stdlib не форматируем строку целиком в горячем пути: только getMessage()
+        # (args могут быть изменяемыми), traceback — в текст, чтобы не держать кадры в очереди
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+
+
+def queue_handler(fmt: str = "json", level=logging.NOTSET):
+    """
+    Фабрика для LOGGING["handlers"] ("()": "core.logs.queue_handler").
+    Поток-слушатель перезапускается в дочернем процессе после fork (gunicorn --preload).
+    """
+    global _listener, _handler
+    first = _listener is None
+    _stop_listener()
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    q = queue.SimpleQueue()
+    _handler = _QueueHandler(q)
+    _handler.setLevel(level)
+    _handler.addFilter(ContextFilter())
+
+    _listener = QueueListener(q, stream, respect_handler_level=False)
+    _listener.start()
+    if first:
+        atexit.register(_stop_listener)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_listener)
+    return _handler
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_listener():
+    # поток слушателя остался в родителе, а его очередь могла быть захвачена в момент fork —
+    # в дочернем процессе новая очередь и новый поток
+    if _listener is None:
+        return
+    q = queue.SimpleQueue()
+    _handler.queue = q
+    _listener.queue = q
+    _listener._thread = None
+    _listener.start()
@@ -0,0 +1,76 @@
+"""
+Одно email-соединение на процесс.
+
+get_connection() на каждое письмо — это новый SMTP-логин или новая
+HTTPS-сессия anymail (TLS-рукопожатие к SendGrid). Здесь соединение
+открывается один раз и переиспользуется, пока не простоит дольше
+EMAIL_CONNECTION_MAX_IDLE (SMTP-серверы сами рвут простаивающие сессии)
+или не случится ошибка — тогда следующее письмо откроет новое.
+
+send() отправляет пачку писем через это соединение, но каждое письмо
+отдельным вызовом: ошибка одного не роняет остальные и привязывается к своему
+заданию очереди (см. outbox: письма из одной выборки воркера уходят пачкой).
+"""
+import logging
+import threading
+import time
+from typing import List, Optional, Sequence
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from .perf import outbound
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_connection = None
+_last_used = 0.0
+
+
+def _get_connection():
+    global _connection, _last_used
+    now = time.monotonic()
+    if _connection is not None and now - _last_used > getattr(settings, "EMAIL_CONNECTION_MAX_IDLE", 60):
+        _close()
+    if _connection is None:
+        _connection = get_connection(timeout=getattr(settings, "EMAIL_TIMEOUT", 8))
+        _connection.open()
+    _last_used = now
+    return _connection
+
+
+def _close():
+    global _connection
+    if _connection is None:
+        return
+    try:
+        _connection.close()
+    except Exception as e:
+        log.debug("mailer: close failed: %s", e)
+    _connection = None
+
+
+def close():
+    """Закрыть соединение процесса (при остановке воркера)."""
+    with _lock:
+        _close()
+
+
+def send(messages: Sequence[EmailMessage]) -> List[Optional[Exception]]:
+    """Отправить письма через общее соединение; результат — ошибка (или None) для каждого письма."""
+    results: List[Optional[Exception]] = []
+    with _lock:
+        for message in messages:
+            try:
+                connection = _get_connection()
+                with outbound("email"):
+                    sent = connection.send_messages([message])
+                if not sent:
+                    raise RuntimeError(f"email to {', '.join(message.recipients())} not sent")
+                results.append(None)
+            except Exception as e:
+                # соединение могло умереть посередине — следующее письмо начнёт с нового
+                _close()
+                results.append(e)
+    return results
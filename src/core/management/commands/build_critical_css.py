@@ -0,0 +1,76 @@
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from core import critical
+from core.sitemap import HUBS, entries
+
+
+def _family(path: str) -> str:
+    if path == reverse("order_create"):
+        return "order"
+    if any(path.startswith(f"/{kind}/") for kind in HUBS):
+        return "hub"
+    return "landing"
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает critical CSS для семейств шаблонов (landing, hub, order) из CDN-стилей "
+        "base.html. Результат — core/critical/<семейство>.css; запускается в release после collectstatic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--css", action="append", default=[], metavar="URL=PATH",
+                            help="Взять стиль из локального файла вместо CDN (можно несколько раз)")
+        parser.add_argument("--timeout", type=float, default=15.0, help="Таймаут загрузки CSS (сек)")
+
+    def handle(self, *args, **opts):
+        overrides = dict(item.split("=", 1) for item in opts["css"])
+        sources = [(url, self._load_css(url, overrides.get(url), opts["timeout"])) for url in critical.CRITICAL_SOURCES]
+
+        pages = defaultdict(list)
+        for entry in entries():
+            pages[_family(entry.path)].append(entry.path)
+
+        host = urlsplit(getattr(settings, "SITE_URL", "")).hostname or "localhost"
+        client = Client(HTTP_HOST=host)
+        out_dir = critical._cache_dir()
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        for family in critical.FAMILIES:
+            tags, classes, ids = set(), set(), set()
+            for path in pages.get(family, []):
+                response = client.get(path, secure=True)
+                if response.status_code != 200:
+                    raise CommandError(f"{path}: HTTP {response.status_code}")
+                t, c, i = critical.used_tokens(response.content.decode("utf-8"))
+                tags |= t
+                classes |= c
+                ids |= i
+
+            css = "".join(critical.extract(text, (tags, classes, ids), base_url=url) for url, text in sources)
+            target = out_dir / f"{family}.css"
+            target.write_text(css, "utf-8")
+            total = sum(len(text) for _, text in sources)
+            self.stdout.write(self.style.SUCCESS(
+                f"{family}: {len(pages.get(family, []))} pages, {len(css)} of {total} bytes -> {target}"
+            ))
+        critical.critical_css.cache_clear()
+
+    @staticmethod
+    def _load_css(url: str, path, timeout: float) -> str:
+        if path:
+            return Path(path).read_text("utf-8")
+        try:
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise CommandError(f"{url}: {e}")
+        return response.text
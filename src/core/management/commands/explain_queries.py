@@ -0,0 +1,84 @@
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import search
+from core.changelist import KEYSET_ORDERING
+from core.models import NotifyOutbox, Order
+from core.views import _link_chat_queryset
+
+
+def _queries():
+    """Ключевые запросы приложения: имя -> (что это, queryset)."""
+    now = timezone.now()
+    status = Order.Status.CONFIRMED
+    queries = {
+        "active_by_pickup": ("активные заявки по окну забора", Order.objects.active().order_by("pickup_time_from")[:50]),
+        "status_newest": (f"заявки в статусе {status}, новые сверху", Order.objects.filter(status=status).order_by("-created_at")[:50]),
+        "changelist": ("первая страница списка в админке", Order.objects.order_by(*KEYSET_ORDERING)[:50]),
+        "changelist_keyset": (
+            "keyset-страница списка в админке",
+            Order.objects.filter(Q(created_at__lt=now) | Q(created_at=now, pk__lt=1000)).order_by(*KEYSET_ORDERING)[:51],
+        ),
+        "link_chat": ("привязка чата по телефону/e-mail", _link_chat_queryset(None, "+79991234567", "client@example.com").order_by("-created_at")[:1]),
+        "public_token": ("заявка по публичному токену (/start)", Order.objects.filter(public_token=uuid.uuid4())),
+        "outbox_due": (
+            "выборка готовых уведомлений воркером",
+            NotifyOutbox.objects.filter(
+                state__in=[NotifyOutbox.State.PENDING, NotifyOutbox.State.PROCESSING], next_attempt_at__lte=now
+            ).order_by("next_attempt_at", "id")[:50],
+        ),
+    }
+    if connection.vendor == "postgresql":
+        queries["admin_search"] = ("поиск в админке по адресу", search.search_orders(Order.objects.all(), "тверская 12"))
+    return queries
+
+
+def _index_names():
+    with connection.cursor() as cursor:
+        names = set()
+        for table in (Order._meta.db_table, NotifyOutbox._meta.db_table):
+            constraints = connection.introspection.get_constraints(cursor, table)
+            names |= {name for name, c in constraints.items() if c["index"] or c["unique"] or c["primary_key"]}
+    return names
+
+
+class Command(BaseCommand):
+    help = (
+        "Печатает EXPLAIN для ключевых запросов приложения и какие индексы они используют. "
+        "Запускать на копии боевой БД (PostgreSQL): на пустой таблице планировщик выбирает seq scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Какие запросы показать (по умолчанию все)")
+        parser.add_argument("--analyze", action="store_true", help="EXPLAIN ANALYZE (только PostgreSQL; запросы выполняются)")
+
+    def handle(self, *args, **opts):
+        queries = _queries()
+        unknown = set(opts["names"]) - set(queries)
+        if unknown:
+            raise CommandError(f"неизвестные запросы: {', '.join(sorted(unknown))}; есть: {', '.join(queries)}")
+        options = {}
+        if opts["analyze"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("--analyze поддерживается только на PostgreSQL")
+            options = {"analyze": True, "buffers": True}
+
+        indexes = _index_names()
+        for name in opts["names"] or queries:
+            title, qs = queries[name]
+            # select_for_update и ANALYZE не должны оставлять следов вне транзакции
+            with transaction.atomic():
+                plan = qs.explain(**options)
+                transaction.set_rollback(True)
+            used = sorted(i for i in indexes if i in plan)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}: {title}"))
+            self.stdout.write(plan)
+            if used:
+                self.stdout.write(self.style.SUCCESS(f"индексы: {', '.join(used)}"))
+            else:
+                self.stdout.write(self.style.WARNING("индексы не используются"))
+            self.stdout.write("")
@@ -0,0 +1,45 @@
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core import mailer
+from core.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Разбирает очередь уведомлений (NotifyOutbox): TG админам/клиентам и email."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=50, help="Сколько записей забирать за проход")
+        parser.add_argument("--concurrency", type=int, default=4, help="Параллельных отправок")
+        parser.add_argument("--idle-sleep", type=float, default=1.0, help="Пауза, если очередь пуста (сек)")
+        parser.add_argument("--once", action="store_true", help="Один проход и выход")
+
+    def handle(self, *args, **opts):
+        stopping = False
+
+        def _stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+            self.stdout.write("notify_worker: stopping after current batch…")
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(
+            f"notify_worker: batch={opts['batch']} concurrency={opts['concurrency']}"
+        )
+        with ThreadPoolExecutor(max_workers=opts["concurrency"], thread_name_prefix="outbox") as pool:
+            while not stopping:
+                stats = drain(pool, batch_size=opts["batch"])
+                if stats["claimed"]:
+                    self.stdout.write(
+                        "notify_worker: claimed={claimed} sent={sent} retry={pending} dead={dead}".format(**stats)
+                    )
+                if opts["once"]:
+                    break
+                if stats["claimed"] < opts["batch"]:
+                    time.sleep(opts["idle_sleep"])
+        mailer.close()
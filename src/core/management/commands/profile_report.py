@@ -0,0 +1,62 @@
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import profiler
+
+
+class Command(BaseCommand):
+    help = (
+        "Сводит профили запросов (*.folded из PROFILER_DIR) в один collapsed-stack файл "
+        "для flamegraph.pl/speedscope и печатает самые горячие функции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--route", default="", help="Только файлы, в имени которых есть эта подстрока")
+        parser.add_argument("--since", help="Только профили не старше даты YYYY-MM-DD")
+        parser.add_argument("--output", help="Куда записать сводный .folded")
+        parser.add_argument("--top", type=int, default=20, help="Сколько функций показать")
+        parser.add_argument("--token", action="store_true",
+                            help=f"Напечатать значение заголовка {profiler.HEADER} и выйти")
+
+    def handle(self, *args, **opts):
+        if opts["token"]:
+            self.stdout.write(f"{profiler.HEADER}: {profiler.make_token()}")
+            return
+
+        since = datetime.strptime(opts["since"], "%Y-%m-%d").timestamp() if opts["since"] else 0
+        files = [
+            p for p in sorted(profiler.profile_dir().glob("*.folded"))
+            if opts["route"] in p.name and p.stat().st_mtime >= since
+        ]
+        if not files:
+            raise CommandError(f"нет профилей в {profiler.profile_dir()}")
+
+        stacks = Counter()
+        for path in files:
+            for line in path.read_text("utf-8").splitlines():
+                stack, _, n = line.rpartition(" ")
+                if stack and n.isdigit():
+                    stacks[stack] += int(n)
+
+        if opts["output"]:
+            Path(opts["output"]).write_text(
+                "".join(f"{stack} {n}\n" for stack, n in sorted(stacks.items())), "utf-8"
+            )
+            self.stdout.write(f"wrote {opts['output']}")
+
+        total = sum(stacks.values())
+        own, inclusive = Counter(), Counter()
+        for stack, n in stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += n
+            for frame in set(frames):
+                inclusive[frame] += n
+
+        self.stdout.write(f"{len(files)} profiles, {total} samples")
+        for title, counter in (("self", own), ("total", inclusive)):
+            self.stdout.write(f"\n-- top by {title} --")
+            for frame, n in counter.most_common(opts["top"]):
+                self.stdout.write(f"{n / total:7.1%} {n:7d}  {frame}")
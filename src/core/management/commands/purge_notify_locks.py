@@ -0,0 +1,83 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import NotifyLock, NotifyOutbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет просроченные замки NotifyLock и старые sent/dead записи очереди "
+        "небольшими пачками (каждая — своя короткая транзакция)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=1000, help="Строк за один DELETE")
+        parser.add_argument("--sleep", type=float, default=0.05, help="Пауза между пачками (сек)")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать")
+        parser.add_argument("--skip-outbox", action="store_true", help="Не трогать NotifyOutbox")
+
+    def handle(self, *args, **opts):
+        now = timezone.now()
+        lock_ttl = timedelta(days=getattr(settings, "NOTIFY_LOCK_TTL_DAYS", 90))
+        outbox_ttl = timedelta(days=getattr(settings, "NOTIFY_OUTBOX_RETENTION_DAYS", 14))
+
+        targets = [(
+            NotifyLock,
+            # expires_at IS NULL — замки до появления TTL, считаем от created_at
+            NotifyLock.objects.filter(
+                Q(expires_at__lte=now) | Q(expires_at__isnull=True, created_at__lte=now - lock_ttl)
+            ),
+        )]
+        if not opts["skip_outbox"]:
+            targets.append((
+                NotifyOutbox,
+                NotifyOutbox.objects.filter(
+                    state__in=[NotifyOutbox.State.SENT, NotifyOutbox.State.DEAD],
+                    updated_at__lte=now - outbox_ttl,
+                ),
+            ))
+
+        for model, qs in targets:
+            self._purge(model, qs, opts)
+
+    def _purge(self, model, qs, opts):
+        table = model._meta.db_table
+        before = model.objects.count()
+        self.stdout.write(f"{table}: rows={before} size={self._table_size(table)}")
+
+        if opts["dry_run"]:
+            self.stdout.write(f"{table}: would delete {qs.count()}")
+            return
+
+        deleted = 0
+        started = time.monotonic()
+        while True:
+            ids = list(qs.order_by("pk").values_list("pk", flat=True)[: opts["chunk"]])
+            if not ids:
+                break
+            n, _ = model.objects.filter(pk__in=ids).delete()
+            deleted += n
+            if len(ids) < opts["chunk"]:
+                break
+            time.sleep(opts["sleep"])
+        elapsed = time.monotonic() - started
+
+        rate = deleted / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{table}: deleted={deleted} in {elapsed:.2f}s ({rate:.0f} rows/s), "
+            f"rows={before - deleted} size={self._table_size(table)}"
+        ))
+
+    @staticmethod
+    def _table_size(table: str) -> str:
+        if connection.vendor != "postgresql":
+            return "n/a"
+        with connection.cursor() as cur:
+            cur.execute("SELECT pg_size_pretty(pg_total_relation_size(%s))", [table])
+            return cur.fetchone()[0]
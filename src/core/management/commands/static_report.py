@@ -0,0 +1,46 @@
+import json
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core.storage import COMPRESSION_REPORT
+
+
+def _kb(n) -> str:
+    return "-" if n is None else f"{n / 1024:.1f}K"
+
+
+class Command(BaseCommand):
+    help = "Сколько байт сэкономило сжатие статики (по отчёту последнего collectstatic)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=30, help="Сколько файлов показать (0 — все)")
+
+    def handle(self, *args, **opts):
+        try:
+            with staticfiles_storage.manifest_storage.open(COMPRESSION_REPORT) as f:
+                rows = json.loads(f.read().decode())
+        except (AttributeError, OSError, ValueError):
+            raise CommandError(f"{COMPRESSION_REPORT} не найден — сначала collectstatic")
+
+        for r in rows:
+            r["best"] = min(r.get("br", r["size"]), r.get("gz", r["size"]))
+            r["saved"] = r["size"] - r["best"]
+        rows.sort(key=lambda r: r["saved"], reverse=True)
+
+        shown = rows[: opts["top"]] if opts["top"] else rows
+        self.stdout.write(f"{'file':<60} {'orig':>9} {'br':>9} {'gz':>9} {'saved':>9}  cache")
+        for r in shown:
+            self.stdout.write(
+                f"{r['name'][-60:]:<60} {_kb(r['size']):>9} {_kb(r.get('br')):>9} {_kb(r.get('gz')):>9} "
+                f"{_kb(r['saved']):>9}  {'hit' if r['cached'] else 'miss'}"
+            )
+
+        total = sum(r["size"] for r in rows)
+        saved = sum(r["saved"] for r in rows)
+        hits = sum(r["cached"] for r in rows)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(rows)} files, {_kb(total)} -> {_kb(total - saved)} "
+            f"(saved {_kb(saved)}, {saved / total:.0%}); compress cache hits {hits}/{len(rows)}"
+            if total else "nothing compressed"
+        ))
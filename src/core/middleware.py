@@ -0,0 +1,258 @@
+"""
+Middleware проекта.
+
+RequestIdMiddleware — request_id для логов (core.logs) и заголовок X-Request-ID.
+
+PerfMiddleware — время запроса, запросы к БД и исходящие HTTP (core.perf),
+заголовок Server-Timing (staff, запросы с токеном метрик или всем при PERF_SERVER_TIMING).
+
+ProfilerMiddleware — сэмплирующий профайлер для выбранных запросов (core.profiler).
+
+StaticFilesMiddleware — WhiteNoise, который под ASGI не уводит весь запрос
+в sync-поток: WhiteNoiseMiddleware умеет только sync, и Django оборачивает
+его (и всё, что ниже по цепочке) в sync_to_async с thread_sensitive=True —
+один поток на процесс, запросы встают в очередь друг за другом. Здесь
+статика отдаётся из async-режима, файл читается в пуле потоков.
+
+PreloadLinkMiddleware — Link-заголовки с preload/preconnect для HTML-страниц.
+
+<link rel="preload|preconnect"> из <head> дублируются в HTTP-заголовок Link:
+браузер начинает тянуть шрифты, CSS и LCP-картинку до разбора HTML, а CDN
+(Cloudflare и т.п.) превращает эти заголовки в 103 Early Hints — gunicorn
+и uvicorn сами 103 отправлять не умеют.
+"""
+import re
+from html import unescape
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import logs, perf, profiler
+
+_LINK_TAG = re.compile(rb"<link\s[^>]*\brel=[\"']?(?:preload|preconnect)\b[^>]*>", re.I)
+_ATTR = re.compile(rb"([\w-]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+)))?")
+# какие атрибуты <link> переносить в заголовок
+_PARAMS = ("rel", "as", "type", "crossorigin", "imagesrcset", "imagesizes", "fetchpriority")
+
+
+def _route(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    return (match.route or match.view_name) if match else "<unmatched>"
+
+
+class RequestIdMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = logs.new_request_id(request.headers.get("X-Request-ID"))
+        token = logs.bind_request(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            logs.unbind_request(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = logs.new_request_id(request.headers.get("X-Request-ID"))
+        token = logs.bind_request(request.request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            logs.unbind_request(token)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+
+class PerfMiddleware:
+    """Идёт сразу за RequestIdMiddleware и меряет всё ниже, включая middleware. Работает и в ASGI без перескока в поток."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "PERF_SERVER_TIMING", False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not perf.enabled():
+            return self.get_response(request)
+        stats, token = perf.start()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            elapsed = self._finish(request, response, stats, token)
+        if self.server_timing or perf.has_token(request) or _is_staff(request):
+            response["Server-Timing"] = perf.server_timing(stats, elapsed)
+        return response
+
+    async def __acall__(self, request):
+        if not perf.enabled():
+            return await self.get_response(request)
+        stats, token = perf.start()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            elapsed = self._finish(request, response, stats, token)
+        if self.server_timing or perf.has_token(request) or await _ais_staff(request):
+            response["Server-Timing"] = perf.server_timing(stats, elapsed)
+        return response
+
+    def _finish(self, request, response, stats, token) -> float:
+        status = response.status_code if response is not None else 500
+        return perf.finish(stats, token, _route(request), request.method, status)
+
+
+def _is_staff(request) -> bool:
+    # без сессионной куки пользователь анонимный — не трогаем сессию и БД
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES or not hasattr(request, "user"):
+        return False
+    return request.user.is_staff
+
+
+async def _ais_staff(request) -> bool:
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES or not hasattr(request, "auser"):
+        return False
+    return (await request.auser()).is_staff
+
+
+class ProfilerMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not profiler.should_profile(request):
+            return self.get_response(request)
+        sampler = profiler.start()
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.save(sampler, _route(request), request.method)
+
+    async def __acall__(self, request):
+        if not profiler.should_profile(request):
+            return await self.get_response(request)
+        sampler = profiler.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            profiler.save(sampler, _route(request), request.method)
+
+
+async def _read_file(response, file):
+    # не thread_sensitive: чтение файла не должно ждать в очереди за sync-представлениями
+    read = sync_to_async(file.read, thread_sensitive=False)
+    while chunk := await read(response.block_size):
+        yield chunk
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+        # serve() открывает файл — тоже вне общего sync-потока
+        response = await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        if response.file_to_stream is not None:
+            # закрытие файла уже зарегистрировано в response (FileResponse), здесь только чтение
+            response.streaming_content = _read_file(response, response.file_to_stream)
+        return response
+
+
+def _link_value(tag: bytes):
+    attrs = {}
+    for m in _ATTR.finditer(tag[5:].rstrip(b"/>")):
+        value = m.group(2) or m.group(3) or m.group(4) or b""
+        attrs[m.group(1).decode().lower()] = unescape(value.decode("utf-8", "replace"))
+    href = attrs.get("href") or attrs.get("imagesrcset", "").split(" ")[0]
+    if not href:
+        return None
+    params = []
+    for name in _PARAMS:
+        if name not in attrs:
+            continue
+        value = attrs[name]
+        params.append(f'{name}="{value}"' if value else name)
+    return f"<{href}>; " + "; ".join(params)
+
+
+def preload_links(content: bytes, limit: int):
+    head_end = content.find(b"</head>")
+    head = content if head_end < 0 else content[:head_end]
+    links = []
+    for tag in _LINK_TAG.findall(head):
+        value = _link_value(tag)
+        if value and value not in links:
+            links.append(value)
+        if len(links) >= limit:
+            break
+    return links
+
+
+class PreloadLinkMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limit = getattr(settings, "PRELOAD_LINK_MAX", 10)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._add_links(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._add_links(await self.get_response(request))
+
+    def _add_links(self, response):
+        if (
+            response.status_code != 200
+            or response.streaming
+            or response.has_header("Link")
+            or not response.get("Content-Type", "").startswith("text/html")
+        ):
+            return response
+        links = preload_links(response.content, self.limit)
+        if links:
+            response["Link"] = ", ".join(links)
+        return response
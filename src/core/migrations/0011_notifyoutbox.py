@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_order_last_client_status_notified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotifyOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('kind', models.CharField(max_length=32)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('state', models.CharField(choices=[('pending', 'Ожидает'), ('processing', 'Отправляется'), ('sent', 'Отправлено'), ('dead', 'Не доставлено')], default='pending', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Уведомление в очереди',
+                'verbose_name_plural': 'Очередь уведомлений',
+                'indexes': [models.Index(fields=['state', 'next_attempt_at'], name='core_outbox_due_idx')],
+            },
+        ),
+    ]
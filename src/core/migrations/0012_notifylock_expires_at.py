@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_notifyoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notifylock',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
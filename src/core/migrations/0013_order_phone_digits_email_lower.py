@@ -0,0 +1,76 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:34
+
+import logging
+import re
+
+from django.db import migrations, models, transaction
+
+log = logging.getLogger(__name__)
+
+
+def _normalize_phone(phone):
+    # копия core.utils.normalize_phone на момент миграции
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    elif len(digits) == 10 and digits.startswith("9"):
+        digits = "7" + digits
+    return digits
+
+
+def backfill(apps, schema_editor):
+    Order = apps.get_model("core", "Order")
+    batch = []
+    for order in Order.objects.only("id", "phone", "email").iterator(chunk_size=1000):
+        order.phone_digits = _normalize_phone(order.phone)
+        order.email_lower = (order.email or "").strip().lower()
+        batch.append(order)
+        if len(batch) >= 1000:
+            Order.objects.bulk_update(batch, ["phone_digits", "email_lower"])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ["phone_digits", "email_lower"])
+
+
+def create_trigram_index(apps, schema_editor):
+    # Необязательный индекс для частичного поиска по телефону (LINK_CHAT_PARTIAL_PHONE).
+    # Только PostgreSQL; без прав на CREATE EXTENSION просто пропускаем.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            schema_editor.execute(
+                "CREATE INDEX IF NOT EXISTS core_order_phone_digits_trgm "
+                "ON core_order USING gin (phone_digits gin_trgm_ops)"
+            )
+    except Exception as e:
+        log.warning("pg_trgm unavailable, skip trigram index: %s", e)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS core_order_phone_digits_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_notifylock_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='email_lower',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=32),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
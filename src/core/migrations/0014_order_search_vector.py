@@ -0,0 +1,61 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Вектор пересчитывается в БД при любом INSERT и при UPDATE исходных колонок —
+# в том числе для bulk_create/bulk_update/QuerySet.update, которые мимо save().
+CREATE_TRIGGER = """
+CREATE OR REPLACE FUNCTION core_order_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.email_lower, '')), 'B') ||
+        setweight(to_tsvector('russian', coalesce(NEW.pickup_address, '') || ' ' || coalesce(NEW.delivery_address, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS core_order_search_vector ON core_order;
+CREATE TRIGGER core_order_search_vector
+    BEFORE INSERT OR UPDATE OF name, email_lower, pickup_address, delivery_address
+    ON core_order FOR EACH ROW EXECUTE FUNCTION core_order_search_vector_update();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS core_order_search_vector ON core_order;
+DROP FUNCTION IF EXISTS core_order_search_vector_update();
+"""
+
+
+def create_search(apps, schema_editor):
+    # Только PostgreSQL; на других БД админка ищет через icontains
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(CREATE_TRIGGER)
+    # заполнить существующие строки: UPDATE исходной колонки запускает триггер
+    schema_editor.execute("UPDATE core_order SET name = name")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS core_order_search_vector_gin ON core_order USING gin (search_vector)"
+    )
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS core_order_search_vector_gin")
+    schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_order_phone_digits_email_lower'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
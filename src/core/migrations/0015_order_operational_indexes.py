@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_order_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-created_at'], name='core_order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['delivered', 'canceled']), _negated=True), fields=['pickup_time_from'], name='core_order_active_pickup_idx'),
+        ),
+        # одиночный индекс по status больше не нужен — его покрывает (status, -created_at);
+        # удаляем после создания составного, чтобы фильтр по статусу не оставался без индекса
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Черновик'), ('confirmed', 'Подтверждён'), ('picked_up', 'Забрали'), ('in_storage', 'На складе'), ('out_for_delivery', 'В пути к доставке'), ('delivered', 'Доставлено'), ('canceled', 'Отменён')], default='draft', max_length=20, verbose_name='Статус'),
+        ),
+    ]
@@ -1,7 +1,56 @@
+import hashlib
 import uuid
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 
+from .utils import normalize_email, normalize_phone
+
+
+# Заявка «в работе» — всё, кроме завершённых. Это же условие у частичного индекса
+# core_order_active_pickup_idx: запрос должен совпадать с ним, чтобы индекс подхватился.
+ACTIVE = ~models.Q(status__in=["delivered", "canceled"])
+
+
+class OrderQuerySet(models.QuerySet):
+    """
+    cache_dates(ttl) — dates()/datetimes() этой выборки берутся из кэша: date_hierarchy
+    в админке на каждой загрузке списка гоняет GROUP BY по всей таблице ради
+    списка лет/месяцев/дней, а он меняется редко.
+    """
+    _dates_ttl = 0
+
+    def active(self):
+        return self.filter(ACTIVE)
+
+    def cache_dates(self, ttl: int):
+        clone = self._chain()
+        clone._dates_ttl = ttl
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._dates_ttl = self._dates_ttl
+        return clone
+
+    def _cached_buckets(self, qs):
+        if not self._dates_ttl:
+            return qs
+        sql, params = qs.query.sql_with_params()
+        key = "order-dates:" + hashlib.md5(f"{qs.db}:{sql}:{params}".encode()).hexdigest()
+        buckets = cache.get(key)
+        if buckets is None:
+            buckets = list(qs)
+            cache.set(key, buckets, self._dates_ttl)
+        return buckets
+
+    def dates(self, field_name, kind, order="ASC"):
+        return self._cached_buckets(super().dates(field_name, kind, order))
+
+    def datetimes(self, field_name, kind, order="ASC", tzinfo=None):
+        return self._cached_buckets(super().datetimes(field_name, kind, order, tzinfo))
+
 
 class Order(models.Model):
     class Status(models.TextChoices):
@@ -17,6 +66,9 @@ class Order(models.Model):
     name = models.CharField("Имя", max_length=120)
     phone = models.CharField("Телефон", max_length=32)
     email = models.EmailField("E‑mail", blank=True)
+    # нормализованные копии для точного индексного поиска (LinkChatView); заполняются в save()
+    phone_digits = models.CharField(max_length=32, blank=True, default="", db_index=True, editable=False)
+    email_lower = models.CharField(max_length=254, blank=True, default="", db_index=True, editable=False)
     telegram = models.CharField("Telegram", max_length=64, blank=True)
     whatsapp = models.CharField("WhatsApp", max_length=64, blank=True)
 
@@ -49,23 +101,46 @@ class Order(models.Model):
 
     # Состояние/служебное
     status = models.CharField(
-        "Статус", max_length=20, choices=Status.choices, default=Status.DRAFT, db_index=True
+        "Статус", max_length=20, choices=Status.choices, default=Status.DRAFT
     )
     comment = models.TextField("Комментарий", blank=True)
 
     public_token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     telegram_chat_id = models.CharField(max_length=32, blank=True, null=True)
     last_client_status_notified = models.CharField(max_length=32, blank=True, default="")
+    # имя/e-mail/адреса для поиска в админке; заполняет триггер PostgreSQL (миграция 0014), см. core/search.py
+    search_vector = SearchVectorField(null=True, editable=False)
 
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Заявка"
         verbose_name_plural = "Заявки"
         ordering = ("-created_at",)
+        indexes = [
+            # «заявки в статусе X, новые сверху»; заодно покрывает фильтр по одному status
+            models.Index(fields=["status", "-created_at"], name="core_order_status_created_idx"),
+            # «активные заявки по окну забора» — индекс только по незавершённым строкам
+            models.Index(fields=["pickup_time_from"], condition=ACTIVE, name="core_order_active_pickup_idx"),
+        ]
 
     def __str__(self):
         return f"#{self.id} {self.name} — {self.pickup_address} → {self.delivery_address}"
 
+    # Статус на момент загрузки из БД: pre_save-сигнал сравнивает с ним
+    # и не делает отдельный SELECT ради старого значения.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "status" in field_names:
+            instance._loaded_status = instance.status
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or "status" in fields:
+            self._loaded_status = self.status
+
     def set_status(self, new_status: str, save: bool = True):
         self.status = new_status
         if save:
@@ -74,6 +149,18 @@ class Order(models.Model):
     def save(self, *args, **kwargs):
         if self.consent_pdn and not self.consent_ts:
             self.consent_ts = timezone.now()
+
+        self.phone_digits = normalize_phone(self.phone)
+        self.email_lower = normalize_email(self.email)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if "phone" in update_fields:
+                update_fields.add("phone_digits")
+            if "email" in update_fields:
+                update_fields.add("email_lower")
+            kwargs["update_fields"] = update_fields
+
         super().save(*args, **kwargs)
 
     def set_consent(self, value: bool):
@@ -85,9 +172,12 @@ class NotifyLock(models.Model):
     """
     Глобальная идемпотентность уведомлений.
     Один и тот же key может быть создан только один раз (UNIQUE).
+    После expires_at запись удаляет manage.py purge_notify_locks
+    (NULL — старые записи, для них срок считается от created_at).
     """
     key = models.CharField(max_length=255, unique=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         verbose_name = "Замок уведомления"
@@ -95,3 +185,38 @@ class NotifyLock(models.Model):
 
     def __str__(self):
         return self.key
+
+
+class NotifyOutbox(models.Model):
+    """
+    Очередь исходящих уведомлений (transactional outbox).
+    Строки пишутся в той же транзакции, что и изменение заказа,
+    а отправкой занимается отдельный процесс: manage.py notify_worker.
+    """
+    class State(models.TextChoices):
+        PENDING = "pending", "Ожидает"
+        PROCESSING = "processing", "Отправляется"
+        SENT = "sent", "Отправлено"
+        DEAD = "dead", "Не доставлено"
+
+    key = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=32)
+    payload = models.JSONField(default=dict, blank=True)
+
+    state = models.CharField(max_length=16, choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Уведомление в очереди"
+        verbose_name_plural = "Очередь уведомлений"
+        indexes = [
+            models.Index(fields=["state", "next_attempt_at"], name="core_outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.key} [{self.state}]"
@@ -1,11 +1,15 @@
 import logging
-import requests
-from typing import Tuple, Callable, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Tuple, Optional, List, Iterable, Set
 from django.conf import settings
 from django.utils.timezone import localtime, now
-from django.core.cache import cache
-from django.db import IntegrityError, transaction
+from django.core.mail import EmailMultiAlternatives
+from django.db import IntegrityError, connection, transaction
 
+from . import mailer, tg_client
 from .models import NotifyLock  # <— используем БД-замок
 
 log = logging.getLogger(__name__)
@@ -69,50 +73,53 @@ def _delivery_block(order):
 
 # ---------- Жёсткая идемпотентность ----------
 
-def _db_try_lock(key: str) -> bool:
-    """
-    Пытается создать запись-замок с уникальным ключом.
-    True — замок создан (можно отправлять).
-    False — замок уже существует (дубль).
-    """
-    try:
-        with transaction.atomic():
-            NotifyLock.objects.create(key=key)
-            return True
-    except IntegrityError:
-        return False
-    except Exception as e:
-        # если с БД что-то не так — не валим процесс, просто логируем
-        log.warning("NotifyLock DB error for key=%s: %s", key, e)
-        return True  # лучше отправить один лишний, чем потерять нотификацию
-
-def send_once(key: str, do_send: Callable[[], None], ttl_seconds: int = 120) -> bool:
+def lock_expires_at(ttl: Optional[timedelta] = None):
+    """Срок хранения замка; по умолчанию NOTIFY_LOCK_TTL_DAYS."""
+    if ttl is None:
+        ttl = timedelta(days=getattr(settings, "NOTIFY_LOCK_TTL_DAYS", 90))
+    return now() + ttl
+
+def _upsert_supported() -> bool:
+    return connection.vendor in ("postgresql", "sqlite") and connection.features.can_return_columns_from_insert
+
+def claim_locks(keys: Iterable[str], ttl: Optional[timedelta] = None) -> Set[str]:
     """
-    Идемпотентная отправка:
-      1) сначала пробуем кэш (быстрый короткий заслон от повтора),
-      2) затем БД-замок (гарантия 'один раз' между процессами/воркерами),
-      3) выполняем do_send().
-    Возвращает True, если отправили; False — если пропустили как дубль.
+    Захватывает сразу пачку ключей одним запросом:
+    INSERT … ON CONFLICT (key) DO NOTHING RETURNING key.
+    Возвращает множество захваченных (новых) ключей; остальные — дубли.
+    Конфликт не ломает транзакцию, поэтому savepoint не нужен.
     """
-    # кэш как "первый барьер"
-    try:
-        if not cache.add(f"once:{key}", "1", timeout=ttl_seconds):
-            log.info("send_once: duplicate key=%s (cache)", key)
-            return False
-    except Exception as e:
-        log.warning("send_once: cache unavailable (%s), fallback to DB only", e)
-
-    # решающее слово — БД
-    if not _db_try_lock(key):
-        log.info("send_once: duplicate key=%s (db)", key)
-        return False
-
-    try:
-        do_send()
-        return True
-    except Exception as e:
-        log.error("send_once: send error for key=%s: %s", key, e)
-        return False
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return set()
+
+    expires_at = lock_expires_at(ttl)
+    if not _upsert_supported():
+        # запасной путь для прочих СУБД: по ключу, с savepoint на каждый
+        claimed = set()
+        for key in keys:
+            try:
+                with transaction.atomic():
+                    NotifyLock.objects.create(key=key, expires_at=expires_at)
+                claimed.add(key)
+            except IntegrityError:
+                pass
+        return claimed
+
+    qn = connection.ops.quote_name
+    created_at = connection.ops.adapt_datetimefield_value(now())
+    expires = connection.ops.adapt_datetimefield_value(expires_at)
+    sql = (
+        f"INSERT INTO {qn(NotifyLock._meta.db_table)} ({qn('key')}, {qn('created_at')}, {qn('expires_at')}) "
+        f"VALUES {', '.join(['(%s, %s, %s)'] * len(keys))} "
+        f"ON CONFLICT ({qn('key')}) DO NOTHING RETURNING {qn('key')}"
+    )
+    params = []
+    for key in keys:
+        params += [key, created_at, expires]
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return {row[0] for row in cur.fetchall()}
 
 # ---------- Отправка в Telegram ----------
 
@@ -120,20 +127,7 @@ def tg_send(text: str, chat_id: str) -> Tuple[bool, int, str]:
     token = getattr(settings, "TELEGRAM_BOT_TOKEN", "")
     if not token or not chat_id:
         return (False, 0, "Missing token or chat_id")
-    try:
-        r = requests.post(
-            f"https://api.telegram.org/bot{token}/sendMessage",
-            data={
-                "chat_id": str(chat_id),
-                "text": text,
-                "parse_mode": "HTML",
-                "disable_web_page_preview": True,
-            },
-            timeout=10,
-        )
-        return (r.ok, r.status_code, r.text)
-    except Exception as e:
-        return (False, 0, f"Exception: {e}")
+    return tg_client.send_message(chat_id, text)
 
 def _normalize_chat_ids(ids):
     if ids is None:
@@ -152,18 +146,70 @@ def _get_admin_chat_ids():
     ids = getattr(settings, "TELEGRAM_CHAT_IDS", [])
     return _normalize_chat_ids(ids)
 
-def tg_send_to_admins(text: str) -> bool:
-    ids = _get_admin_chat_ids()
+@dataclass
+class ChatResult:
+    chat_id: str
+    ok: bool
+    status: int
+    body: str
+
+
+@dataclass
+class FanoutResult:
+    """Итог рассылки по нескольким чатам; bool(result) — «все дошли»."""
+    results: List[ChatResult] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.results) and all(r.ok for r in self.results)
+
+    @property
+    def failed(self) -> List[str]:
+        return [r.chat_id for r in self.results if not r.ok]
+
+    def __bool__(self):
+        return self.ok
+
+
+_fanout_pool: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+def _get_fanout_pool() -> ThreadPoolExecutor:
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _fanout_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "TELEGRAM_FANOUT_WORKERS", 5),
+                    thread_name_prefix="tg-fanout",
+                )
+    return _fanout_pool
+
+def tg_send_to_admins(text: str, chat_ids=None, parallel: Optional[bool] = None) -> FanoutResult:
+    """
+    Рассылка админам. chat_ids — подмножество (например, для повтора только
+    по упавшим чатам), по умолчанию все TELEGRAM_CHAT_IDS.
+    parallel=True — чаты отправляются одновременно на общем ограниченном пуле,
+    так что задержка ≈ одному запросу, а не их сумме.
+    """
+    ids = _normalize_chat_ids(chat_ids) if chat_ids is not None else _get_admin_chat_ids()
     if not ids:
         log.warning("tg_send_to_admins: no admin chat ids configured (ADMIN_TG_CHAT_ID/TELEGRAM_CHAT_IDS empty)")
-        return False
-    ok = True
-    for cid in ids:
-        r = tg_send(text, cid)
-        ok = ok and r[0]
-        if not r[0]:
-            log.error("tg_send_to_admins failed for %s: %s %s", cid, r[1], r[2])
-    return ok
+        return FanoutResult()
+
+    if parallel is None:
+        parallel = getattr(settings, "TELEGRAM_FANOUT_PARALLEL", True)
+
+    if parallel and len(ids) > 1:
+        raw = list(_get_fanout_pool().map(lambda cid: tg_send(text, cid), ids))
+    else:
+        raw = [tg_send(text, cid) for cid in ids]
+
+    result = FanoutResult([ChatResult(cid, *r) for cid, r in zip(ids, raw)])
+    for r in result.results:
+        if not r.ok:
+            log.error("tg_send_to_admins failed for %s: %s %s", r.chat_id, r.status, r.body)
+    return result
 
 def tg_send_to_order(order, text: str) -> Tuple[bool, int, str]:
     chat_id = str(getattr(order, "telegram_chat_id", "") or "").strip()
@@ -178,6 +224,37 @@ def tg_send_to_order(order, text: str) -> Tuple[bool, int, str]:
 
     return tg_send(text, chat_id)
 
+# ---------- Отправка email ----------
+
+def build_email(subject: str, message: str, to_email: str, ADMIN_BCC: str | None = None) -> EmailMultiAlternatives:
+    """Письмо text+html с общими заголовками."""
+    bcc = [ADMIN_BCC] if ADMIN_BCC else []
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=message,  # plain text
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[to_email],
+        bcc=bcc,
+        reply_to=[settings.DEFAULT_FROM_EMAIL],
+        headers={"X-DD-App": "drop-delivery"},
+    )
+    # простая html-версия
+    html = message.replace("\n", "<br>")
+    email.attach_alternative(html, "text/html")
+    return email
+
+
+def email_send(subject: str, message: str, to_email: str, ADMIN_BCC: str | None = None):
+    """Синхронная отправка одного письма через общее соединение процесса (core.mailer)."""
+    if not to_email:
+        log.info("email_send: skip (empty to)")
+        return
+    (error,) = mailer.send([build_email(subject, message, to_email, ADMIN_BCC)])
+    if error is not None:
+        log.error("email_send error: %s", error)
+        raise error
+    log.info("email_send: to=%s subject=%s sent=1", to_email, subject)
+
 # ---------- Шаблоны сообщений для TG ----------
 
 def format_status_message(order, old_status=None):
@@ -200,14 +277,17 @@ def send_status_update(order, old_status=None):
     text = format_status_message(order, old_status)
     return tg_send_to_order(order, text)
 
-def send_welcome(order):
+def send_welcome(order, chat_id: Optional[str] = None):
+    """Приветствие в чат chat_id (по умолчанию — в текущий чат заказа)."""
     text = _join(
         "👋 Готово! Мы будем присылать обновления по вашему заказу.",
         f"Заказ #{order.pk}",
         _pickup_block(order),
         _delivery_block(order),
     )
-    return tg_send_to_order(order, text)
+    if chat_id is None:
+        return tg_send_to_order(order, text)
+    return tg_send(text, chat_id)
 
 def build_deeplink_for_order(order_id: int) -> str:
     username = getattr(settings, "TELEGRAM_BOT_USERNAME", "") or getattr(settings, "TELEGRAM_BOT_NAME", "")
@@ -0,0 +1,305 @@
+import logging
+from concurrent.futures import Executor
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import logs, mailer
+from .models import NotifyOutbox, Order
+from .notify import (
+    build_email,
+    claim_locks,
+    _get_admin_chat_ids,
+    email_send,
+    send_welcome,
+    tg_send_to_admins,
+    tg_send_to_order,
+)
+
+log = logging.getLogger(__name__)
+
+State = NotifyOutbox.State
+
+
+class Job(NamedTuple):
+    key: str
+    kind: str
+    payload: dict
+
+
+class DeliveryError(Exception):
+    """
+    Ошибка доставки уведомления.
+    permanent=True — повтор не поможет, запись сразу уходит в dead.
+    payload — если задан, следующая попытка получит его вместо исходного
+    (например, только чаты, в которые отправить не удалось).
+    """
+    def __init__(self, message: str, permanent: bool = False, payload: Optional[dict] = None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.payload = payload
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+# ---------- Постановка в очередь ----------
+
+def enqueue(key: str, kind: str, payload: Optional[dict] = None) -> bool:
+    """
+    Ставит уведомление в очередь.
+    Вызывать внутри транзакции, меняющей заказ: запись станет видна воркеру
+    только вместе с коммитом. Замок NotifyLock и строка очереди создаются атомарно.
+    Возвращает False, если такой ключ уже ставился (дубль).
+    """
+    return bool(enqueue_many([Job(key, kind, payload or {})]))
+
+
+def enqueue_many(jobs: Iterable[Job]) -> List[Job]:
+    """
+    Пакетная постановка: все замки — одним INSERT … ON CONFLICT,
+    все строки очереди — одним bulk_create. Возвращает реально поставленные задания.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    # savepoint=False: внутри чужой транзакции не плодим savepoint,
+    # в autocommit — обычная транзакция на замки + очередь
+    with transaction.atomic(savepoint=False):
+        claimed = claim_locks(j.key for j in jobs)
+        fresh = [j for j in jobs if j.key in claimed]
+        for j in jobs:
+            if j.key not in claimed:
+                log.info("outbox: duplicate key=%s", j.key)
+        if fresh:
+            NotifyOutbox.objects.bulk_create(
+                [NotifyOutbox(key=j.key, kind=j.kind, payload=j.payload) for j in fresh],
+                ignore_conflicts=True,
+            )
+    return fresh
+
+# ---------- Обработчики ----------
+
+HANDLERS: Dict[str, Callable[[dict], None]] = {}
+
+
+def handler(kind: str):
+    def deco(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return deco
+
+
+# Обработчики пачкой: получают payload'ы всех заданий своего вида из одной выборки
+# воркера и возвращают ошибку (или None) для каждого. Используются вместо HANDLERS.
+BATCH_HANDLERS: Dict[str, Callable[[List[dict]], List[Optional[Exception]]]] = {}
+
+
+def batch_handler(kind: str):
+    def deco(fn):
+        BATCH_HANDLERS[kind] = fn
+        return fn
+    return deco
+
+
+@handler("tg_admins")
+def _send_tg_admins(payload: dict):
+    if not _get_admin_chat_ids():
+        log.warning("outbox: no admin chat ids configured, skip")
+        return
+    result = tg_send_to_admins(payload["text"], chat_ids=payload.get("chat_ids"))
+    if not result:
+        # повторяем только по тем чатам, куда не дошло
+        raise DeliveryError(
+            f"telegram admins: failed for {', '.join(result.failed)}",
+            payload={**payload, "chat_ids": result.failed},
+        )
+
+
+def _is_client_chat(chat_id) -> bool:
+    # клиент не привязал чат (или это админский чат) — отправлять некуда
+    chat_id = str(chat_id or "").strip()
+    return bool(chat_id) and chat_id not in _get_admin_chat_ids()
+
+
+def _has_client_chat(order) -> bool:
+    return _is_client_chat(order.telegram_chat_id)
+
+
+def _tg_error(what: str, code: int, body: str) -> DeliveryError:
+    # 4xx (кроме 429) — чат удалён/бот заблокирован, повтор не поможет
+    permanent = 400 <= code < 500 and code != 429
+    return DeliveryError(f"{what}: {code} {body[:200]}", permanent=permanent)
+
+
+@handler("tg_client")
+def _send_tg_client(payload: dict):
+    order = Order.objects.filter(pk=payload["order_id"]).first()
+    if order is None:
+        return
+
+    status = payload.get("status")
+    if status and order.last_client_status_notified == status:
+        return
+
+    if not _has_client_chat(order):
+        return
+
+    ok, code, body = tg_send_to_order(order, payload["text"])
+    if not ok:
+        raise _tg_error("telegram client", code, body)
+
+    if status:
+        Order.objects.filter(pk=order.pk).update(last_client_status_notified=status)
+
+
+@handler("tg_welcome")
+def _send_tg_welcome(payload: dict):
+    order = Order.objects.filter(pk=payload["order_id"]).first()
+    if order is None:
+        return
+    # чат из момента постановки — по нему и ключ дедупликации; если чат с тех пор
+    # перепривязали, у нового будет своё приветствие. Старые записи без chat_id — в текущий чат.
+    chat_id = str(payload.get("chat_id") or order.telegram_chat_id or "").strip()
+    if not _is_client_chat(chat_id):
+        return
+    ok, code, body = send_welcome(order, chat_id)
+    if not ok:
+        raise _tg_error("telegram welcome", code, body)
+
+
+@handler("email")
+def _send_email(payload: dict):
+    email_send(payload["subject"], payload["body"], payload["to"])
+
+
+@batch_handler("email")
+def _send_email_batch(payloads: List[dict]) -> List[Optional[Exception]]:
+    # все письма выборки — через одно соединение (core.mailer), а не логин/TLS на каждое
+    results: List[Optional[Exception]] = [None] * len(payloads)
+    indexes = [i for i, p in enumerate(payloads) if p.get("to")]
+    messages = [build_email(payloads[i]["subject"], payloads[i]["body"], payloads[i]["to"]) for i in indexes]
+    for i, error in zip(indexes, mailer.send(messages)):
+        results[i] = error
+    log.info("outbox: email batch sent=%s failed=%s", sum(e is None for e in results), sum(e is not None for e in results))
+    return results
+
+# ---------- Воркер ----------
+
+def _backoff(attempts: int) -> timedelta:
+    """Экспоненциальная пауза: base, 2*base, 4*base … но не больше cap."""
+    base = _setting("NOTIFY_OUTBOX_BACKOFF", 5)
+    cap = _setting("NOTIFY_OUTBOX_BACKOFF_MAX", 900)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), cap))
+
+
+def claim_batch(limit: int) -> List[NotifyOutbox]:
+    """
+    Забирает до limit готовых к отправке записей и помечает их processing.
+    next_attempt_at у processing-записи — срок аренды: если воркер умер,
+    запись снова станет доступной после его истечения.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=_setting("NOTIFY_OUTBOX_LEASE", 300))
+    with transaction.atomic():
+        jobs = list(
+            NotifyOutbox.objects
+            .filter(state__in=[State.PENDING, State.PROCESSING], next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")
+            .select_for_update(skip_locked=True)[:limit]
+        )
+        if jobs:
+            NotifyOutbox.objects.filter(pk__in=[j.pk for j in jobs]).update(
+                state=State.PROCESSING,
+                attempts=F("attempts") + 1,
+                next_attempt_at=now + lease,
+                updated_at=now,
+            )
+            for j in jobs:
+                j.attempts += 1
+    return jobs
+
+
+def _run(job: NotifyOutbox) -> Optional[Exception]:
+    try:
+        with logs.bind(key=job.key):
+            fn = HANDLERS.get(job.kind)
+            if fn is None:
+                raise DeliveryError(f"unknown kind: {job.kind}", permanent=True)
+            fn(job.payload)
+        return None
+    except Exception as e:
+        return e
+    finally:
+        # потоки пула живут долго — не держим протухшие соединения
+        close_old_connections()
+
+
+def _run_batch(kind: str, jobs: List[NotifyOutbox]) -> List[Optional[Exception]]:
+    try:
+        return BATCH_HANDLERS[kind]([j.payload for j in jobs])
+    except Exception as e:
+        return [e] * len(jobs)
+    finally:
+        close_old_connections()
+
+
+def _finish(job: NotifyOutbox, error: Optional[Exception]) -> str:
+    now = timezone.now()
+    max_attempts = _setting("NOTIFY_OUTBOX_MAX_ATTEMPTS", 8)
+
+    if error is None:
+        fields = {"state": State.SENT, "last_error": ""}
+    elif getattr(error, "permanent", False) or job.attempts >= max_attempts:
+        log.error("outbox: dead key=%s attempts=%s: %s", job.key, job.attempts, error)
+        fields = {"state": State.DEAD, "last_error": str(error)}
+    else:
+        log.warning("outbox: retry key=%s attempts=%s: %s", job.key, job.attempts, error)
+        fields = {
+            "state": State.PENDING,
+            "next_attempt_at": now + _backoff(job.attempts),
+            "last_error": str(error),
+        }
+        if getattr(error, "payload", None) is not None:
+            fields["payload"] = error.payload
+
+    NotifyOutbox.objects.filter(pk=job.pk).update(updated_at=now, **fields)
+    return fields["state"]
+
+
+def drain(executor: Executor, batch_size: int = 50) -> Dict[str, int]:
+    """
+    Один проход воркера: забрать пачку, отправить параллельно (не больше,
+    чем потоков в executor), записать результат. Возвращает счётчики по состояниям.
+    Задания с обработчиком из BATCH_HANDLERS (email) уходят одной задачей на вид.
+    """
+    jobs = claim_batch(batch_size)
+    stats = {"claimed": len(jobs), "sent": 0, "pending": 0, "dead": 0}
+
+    batches: Dict[str, List[NotifyOutbox]] = {}
+    single = []
+    for job in jobs:
+        if job.kind in BATCH_HANDLERS:
+            batches.setdefault(job.kind, []).append(job)
+        else:
+            single.append(job)
+
+    futures = [(group, executor.submit(_run_batch, kind, group)) for kind, group in batches.items()]
+    for job, error in zip(single, executor.map(_run, single)):
+        stats[_finish(job, error)] += 1
+    for group, future in futures:
+        for job, error in zip(group, future.result()):
+            stats[_finish(job, error)] += 1
+    return stats
+
+
+def requeue(queryset) -> int:
+    """Вернуть записи (обычно dead) в очередь с нуля."""
+    return queryset.update(
+        state=State.PENDING, attempts=0, next_attempt_at=timezone.now(), last_error=""
+    )
@@ -0,0 +1,116 @@
+"""
+Кэш готовых страниц для статичных SEO-страниц.
+
+Ключ — схема + хост + путь + версия деплоя. Версия считается один раз на процесс
+по mtime шаблонов проекта и манифеста статики (плюс SHA коммита, если его отдаёт PaaS),
+так что после деплоя старые записи просто перестают находиться.
+Ответы отдаются с ETag/Last-Modified и отвечают 304 на условные GET.
+"""
+import hashlib
+import os
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.template import engines
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def _project_template_dirs():
+    base = Path(settings.BASE_DIR).resolve()
+    for engine in engines.all():
+        for d in getattr(engine, "template_dirs", ()):
+            d = Path(d).resolve()
+            if base in d.parents or d == base:
+                yield d
+
+
+def _latest_mtime(paths) -> float:
+    latest = 0.0
+    for p in paths:
+        p = Path(p)
+        if p.is_file():
+            latest = max(latest, p.stat().st_mtime)
+        elif p.is_dir():
+            for root, _, files in os.walk(p):
+                for name in files:
+                    latest = max(latest, os.stat(os.path.join(root, name)).st_mtime)
+    return latest
+
+
+@lru_cache(maxsize=1)
+def deploy_version() -> Tuple[str, float]:
+    """(версия, время последнего изменения шаблонов/манифеста статики)."""
+    paths = list(_project_template_dirs())
+    paths.append(Path(settings.STATIC_ROOT) / "staticfiles.json")
+    mtime = _latest_mtime(paths)
+    commit = os.getenv("RAILWAY_GIT_COMMIT_SHA", "") or os.getenv("GIT_COMMIT", "")
+    digest = hashlib.md5(f"{commit}:{mtime}".encode()).hexdigest()[:12]
+    return digest, mtime
+
+
+def _cacheable(request) -> bool:
+    return (
+        getattr(settings, "PAGE_CACHE_ENABLED", True)
+        and not settings.DEBUG
+        and request.method in ("GET", "HEAD")
+        and not request.GET
+    )
+
+
+def page_key(request, prefix: str = "page") -> str:
+    version, _ = deploy_version()
+    return f"{prefix}:{version}:{request.scheme}:{request.get_host()}:{request.path}"
+
+
+def conditional_page(request, content: bytes, content_type: str, etag: str, last_modified: float):
+    """Ответ из готовых байтов: 304, если клиент прислал совпадающий ETag/дату."""
+    response = HttpResponse(content, content_type=content_type)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=getattr(settings, "PAGE_CACHE_MAX_AGE", 300))
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified), response=response
+    )
+
+
+def cached_page(view):
+    """
+    Декоратор для представлений, чей ответ зависит только от хоста и пути.
+    Страницы с CSRF-токеном, cookies или не-200 ответы не кэшируются.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable(request):
+            return view(request, *args, **kwargs)
+
+        store = caches[getattr(settings, "PAGE_CACHE_ALIAS", "default")]
+        key = page_key(request)
+        entry = store.get(key)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+            if (
+                response.status_code != 200
+                or response.streaming
+                or response.cookies
+                or request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+            ):
+                return response
+            content = response.content
+            entry = (
+                content,
+                response.get("Content-Type", "text/html; charset=utf-8"),
+                '"%s"' % hashlib.md5(content).hexdigest(),
+            )
+            store.set(key, entry, getattr(settings, "PAGE_CACHE_TIMEOUT", 3600))
+
+        content, content_type, etag = entry
+        return conditional_page(request, content, content_type, etag, deploy_version()[1])
+
+    return wrapper
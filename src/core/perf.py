@@ -0,0 +1,180 @@
+"""
+Метрики запросов: время по маршрутам, запросы к БД, исходящие HTTP (Telegram/SendGrid).
+
+Запрос собирает свою статистику в RequestStats (contextvar, доживает до
+sync_to_async), PerfMiddleware складывает её в гистограммы процесса и отдаёт
+в Server-Timing — только staff и запросам с токеном метрик, если
+PERF_SERVER_TIMING не включён для всех. /metrics/ отдаёт их в текстовом формате Prometheus.
+
+Счётчики живут в памяти процесса: у каждого воркера gunicorn свои, поэтому
+в выдаче есть метка pid, а суммировать надо на стороне Prometheus.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("started", "db_count", "db_time", "outbound")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.outbound: Dict[str, float] = {}
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("perf_request_stats", default=None)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+
+    def observe(self, name: str, labels: Tuple, value: float):
+        with self._lock:
+            h = self.histograms.get((name, labels))
+            if h is None:
+                h = self.histograms[(name, labels)] = Histogram()
+            h.observe(value)
+
+    def inc(self, name: str, labels: Tuple, value: float = 1):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            hist = {k: (list(h.counts), h.total, h.count) for k, h in self.histograms.items()}
+            return hist, dict(self.counters)
+
+
+registry = Registry()
+
+HELP = {
+    "dd_request_duration_seconds": ("histogram", "Время обработки запроса"),
+    "dd_requests_total": ("counter", "Запросы по маршруту и статусу"),
+    "dd_db_queries_total": ("counter", "Запросы к БД из HTTP-запросов"),
+    "dd_db_seconds_total": ("counter", "Время в БД из HTTP-запросов"),
+    "dd_outbound_seconds": ("histogram", "Исходящие HTTP-вызовы (telegram, email)"),
+}
+
+
+def enabled() -> bool:
+    return getattr(settings, "PERF_METRICS_ENABLED", True)
+
+
+def start() -> Tuple[RequestStats, object]:
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish(stats: RequestStats, token, route: str, method: str, status: int) -> float:
+    _current.reset(token)
+    elapsed = time.perf_counter() - stats.started
+    registry.observe("dd_request_duration_seconds", (("route", route), ("method", method)), elapsed)
+    registry.inc("dd_requests_total", (("route", route), ("method", method), ("status", str(status))))
+    if stats.db_count:
+        registry.inc("dd_db_queries_total", (("route", route),), stats.db_count)
+        registry.inc("dd_db_seconds_total", (("route", route),), stats.db_time)
+    return elapsed
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """execute_wrapper: вешается на каждое соединение (signals.connection_created)."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_count += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    if enabled() and db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+@contextmanager
+def outbound(service: str):
+    """Засечь исходящий вызов: в гистограмму процесса и в Server-Timing текущего запроса."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe("dd_outbound_seconds", (("service", service),), elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.outbound[service] = stats.outbound.get(service, 0.0) + elapsed
+
+
+def has_token(request) -> bool:
+    """Authorization: Bearer <PERF_METRICS_TOKEN>; без токена в настройках — всегда False."""
+    token = getattr(settings, "PERF_METRICS_TOKEN", "")
+    return bool(token) and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+def server_timing(stats: RequestStats, elapsed: float) -> str:
+    parts = [f"app;dur={elapsed * 1000:.1f}"]
+    if stats.db_count:
+        parts.append(f'db;dur={stats.db_time * 1000:.1f};desc="{stats.db_count} queries"')
+    for service, seconds in sorted(stats.outbound.items()):
+        parts.append(f"{service};dur={seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def _labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = labels + (("pid", str(os.getpid())),) + extra
+    return ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+
+
+def render_metrics() -> str:
+    hist, counters = registry.snapshot()
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{{{_labels(labels)}}} {value:g}")
+            continue
+        for (n, labels), (counts, total, count) in sorted(hist.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, c in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{{{_labels(labels, (('le', le),))}}} {cumulative}")
+            lines.append(f"{name}_sum{{{_labels(labels)}}} {total:.6f}")
+            lines.append(f"{name}_count{{{_labels(labels)}}} {count}")
+    return "\n".join(lines) + "\n"
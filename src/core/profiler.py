@@ -0,0 +1,136 @@
+"""
+Сэмплирующий профайлер для боевых запросов.
+
+Включается на долю запросов (PROFILER_SAMPLE_RATE) или на один запрос —
+заголовком X-DD-Profile с подписанным токеном (manage.py profile_report --token).
+Пока выключен, стоит одно сравнение на запрос.
+
+Во время запроса фоновый поток раз в PROFILER_INTERVAL снимает стек потока,
+обрабатывающего запрос, и пишет итог в PROFILER_DIR в формате collapsed stacks
+(«a;b;c <число сэмплов>») — его понимают flamegraph.pl и speedscope.
+В ASGI-режиме снимается поток event loop: вызовы через sync_to_async
+(ORM) в сэмплы не попадают.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.core import signing
+
+HEADER = "X-DD-Profile"
+_SALT = "core.profiler"
+_MAX_DEPTH = 200
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def profile_dir() -> Path:
+    return Path(_setting("PROFILER_DIR", Path(settings.BASE_DIR) / ".cache" / "profiles"))
+
+
+def make_token() -> str:
+    return signing.TimestampSigner(salt=_SALT).sign("profile")
+
+
+def _valid_token(token: str) -> bool:
+    try:
+        signing.TimestampSigner(salt=_SALT).unsign(token, max_age=_setting("PROFILER_TOKEN_MAX_AGE", 3600))
+        return True
+    except signing.BadSignature:
+        return False
+
+
+def should_profile(request) -> bool:
+    token = request.headers.get(HEADER)
+    if token:
+        return _valid_token(token)
+    rate = _setting("PROFILER_SAMPLE_RATE", 0.0)
+    return rate > 0 and random.random() < rate
+
+
+_roots = None
+
+
+def _frame_name(code) -> str:
+    global _roots
+    if _roots is None:
+        _roots = sorted({str(Path(p).resolve()) for p in sys.path if p} | {str(Path(settings.BASE_DIR).resolve())},
+                        key=len, reverse=True)
+    filename = code.co_filename
+    for root in _roots:
+        if filename.startswith(root + os.sep):
+            filename = filename[len(root) + 1:]
+            break
+    module = filename.rsplit(".", 1)[0].replace(os.sep, ".")
+    return f"{module}:{code.co_name}"
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < _MAX_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    # collapsed stacks: от корня к листу, без ';' в именах
+    return ";".join(n.replace(";", ":") for n in reversed(names))
+
+
+class Sampler:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def stop(self) -> float:
+        self._stop.set()
+        self._thread.join()
+        return time.perf_counter() - self.started
+
+
+def start() -> Sampler:
+    return Sampler(threading.get_ident(), _setting("PROFILER_INTERVAL", 0.005)).start()
+
+
+def _slug(route: str) -> str:
+    slug = "".join(c if c.isalnum() else "-" for c in route).strip("-")
+    return slug[:60] or "root"
+
+
+def save(sampler: Sampler, route: str, method: str) -> Optional[Path]:
+    elapsed = sampler.stop()
+    if not sampler.stacks:
+        return None
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    path = directory / f"{stamp}-{method}-{_slug(route)}-{elapsed * 1000:.0f}ms-{os.getpid()}.folded"
+    path.write_text("".join(f"{stack} {n}\n" for stack, n in sampler.stacks.most_common()), "utf-8")
+    _rotate(directory)
+    return path
+
+
+def _rotate(directory: Path):
+    keep = _setting("PROFILER_MAX_FILES", 500)
+    files = sorted(directory.glob("*.folded"), key=lambda p: p.stat().st_mtime)
+    for old in files[:-keep] if len(files) > keep else []:
+        old.unlink(missing_ok=True)
@@ -0,0 +1,88 @@
+"""
+Поиск заявок для админки.
+
+На PostgreSQL текст ищется по Order.search_vector (tsvector с GIN-индексом,
+его поддерживает триггер из миграции 0014) с сортировкой по релевантности,
+а цифры — по номеру заявки и phone_digits (btree для точного номера,
+pg_trgm-индекс из 0013 для куска номера). Слова с цифрами и куски e-mail
+(«д.12», «mail.ru») ищутся icontains, как раньше. На других БД — обычный icontains.
+"""
+import re
+from typing import List, Optional, Tuple
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+
+from .utils import normalize_phone
+
+CONFIG = "russian"
+RANK = "search_rank"
+
+# поля, по которым искала админка до tsvector (search_fields)
+FIELDS = ("name", "phone", "email", "pickup_address", "delivery_address")
+
+_PHONE_CHARS = re.compile(r"[\s()+-]")
+_LETTERS = re.compile(r"^[^\W\d_]+$")
+_PUNCT = ",;:!?\"'«»()"
+
+
+def supported(qs) -> bool:
+    return connections[qs.db].vendor == "postgresql"
+
+
+def digits_only(term: str) -> Optional[str]:
+    """Цифры, если строка похожа на номер заявки или телефона (+7 (999) 123-45-67)."""
+    digits = _PHONE_CHARS.sub("", term)
+    return digits if digits.isdigit() else None
+
+
+def _tokens(term: str) -> Tuple[List[str], List[str]]:
+    """(слова, остальное): слова из одних букв есть в search_vector как лексемы, остальное ищем icontains."""
+    words, other = [], []
+    for token in term.split():
+        token = token.strip(_PUNCT)
+        if token:
+            (words if _LETTERS.match(token) else other).append(token)
+    return words, other
+
+
+def text_query(words: List[str]) -> SearchQuery:
+    """Все слова обязательны, каждое — как префикс: «тверск» найдёт «Тверская»."""
+    return SearchQuery(" & ".join(f"'{w}':*" for w in words), search_type="raw", config=CONFIG)
+
+
+def _token_filter(token: str) -> Q:
+    # цифры, кусок e-mail или телефона: как раньше в админке — icontains по всем полям поиска
+    f = Q()
+    for name in FIELDS:
+        f |= Q(**{f"{name}__icontains": token})
+    digits = re.sub(r"\D", "", token)
+    if len(digits) >= 3:
+        f |= Q(phone_digits__contains=digits)
+    if token.isdigit() and len(token) <= 9:
+        f |= Q(pk=int(token))
+    return f
+
+
+def search_orders(qs, term: str):
+    """
+    Отфильтровать заявки по строке поиска; все слова строки обязательны.
+    Если в строке есть слова из букв, выдача получает аннотацию search_rank.
+    """
+    digits = digits_only(term)
+    if digits:
+        f = Q(phone_digits=normalize_phone(digits))
+        if len(digits) <= 9:
+            f |= Q(pk=int(digits))
+        if len(digits) >= 4:
+            f |= Q(phone_digits__contains=digits)
+        return qs.filter(f)
+
+    words, other = _tokens(term)
+    for token in other:
+        qs = qs.filter(_token_filter(token))
+    if words:
+        query = text_query(words)
+        qs = qs.filter(search_vector=query).annotate(**{RANK: SearchRank(F("search_vector"), query)})
+    return qs
@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order
+from .outbox import enqueue_many
+from .signals import order_status_jobs
+
+
+@dataclass
+class TransitionResult:
+    changed: int = 0
+    enqueued: int = 0
+
+
+def bulk_transition_status(queryset, new_status: str) -> TransitionResult:
+    """
+    Массовая смена статуса одним UPDATE вместо save() на каждую строку.
+    Число запросов не зависит от размера выборки:
+    SELECT … FOR UPDATE (старые статусы и данные для сообщений), UPDATE,
+    затем пакетная постановка уведомлений (замки + очередь).
+    Сигналы pre_save/post_save не срабатывают — уведомления ставим сами.
+    """
+    with transaction.atomic():
+        # через pk__in: у выборки из админки может быть DISTINCT/сортировка,
+        # с которыми FOR UPDATE не работает
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=queryset.values("pk"))
+            .exclude(status=new_status)
+            .order_by("pk")
+        )
+        if not orders:
+            return TransitionResult()
+
+        now = timezone.now()
+        Order.objects.filter(pk__in=[o.pk for o in orders]).update(status=new_status, updated_at=now)
+
+        jobs = []
+        for order in orders:
+            old_status = order.status
+            order.status = new_status
+            order.updated_at = now
+            jobs += order_status_jobs(order, old_status)
+        enqueued = enqueue_many(jobs)
+
+    return TransitionResult(changed=len(orders), enqueued=len(enqueued))
@@ -1,192 +1,159 @@
 import logging
-import threading
-import time
-from typing import Callable
+from typing import List
 
-from django.conf import settings
-from django.db import transaction
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
-from django.core.mail import EmailMultiAlternatives, get_connection
 
 from .models import Order
 from .notify import (
-    tg_send_to_admins,
     format_admin_new_order,
     format_status_message,
-    send_status_update,
     status_ru,
     format_dt,
-    send_once,
 )
+from . import logs
+from .outbox import Job, enqueue_many
 
 log = logging.getLogger(__name__)
-log.warning("core.signals imported (stable)")
 
-# ---------- helpers: async + retry ----------
+# ---------- задания для очереди уведомлений ----------
 
-def _spawn(fn: Callable, *a, **kw):
-    t = threading.Thread(target=fn, args=a, kwargs=kw, daemon=True)
-    t.start()
+def order_created_jobs(order: Order) -> List[Job]:
+    key_base = f"notify:order:{order.pk}:created"
+    jobs = [Job(key_base + ":admins", "tg_admins", {"text": format_admin_new_order(order)})]
 
-def email_send(subject: str, message: str, to_email: str, ADMIN_BCC: str | None = None):
-    """Синхронная отправка text+html (используем из async-обёртки/retry)."""
-    if not to_email:
-        log.info("email_send: skip (empty to)")
-        return
-    try:
-        bcc = [ADMIN_BCC] if ADMIN_BCC else []
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=message,  # plain text
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[to_email],
-            bcc=bcc,
-            reply_to=[settings.DEFAULT_FROM_EMAIL],
-            headers={"X-DD-App": "drop-delivery"},
-        )
-        # простая html-версия
-        html = message.replace("\n", "<br>")
-        email.attach_alternative(html, "text/html")
-
-        conn = get_connection(timeout=getattr(settings, "EMAIL_TIMEOUT", 8))
-        sent = conn.send_messages([email])
-        log.info("email_send: to=%s subject=%s sent=%s", to_email, subject, sent)
-    except Exception as e:
-        log.error("email_send error: %s", e)
-        raise
-
-def email_send_async(subject: str, message: str, to_email: str,
-                     attempts: int = 3, base_delay: float = 1.0):
-    """Фоновая отправка с ретраями и экспоненциальной паузой (1s, 2s, 4s)."""
-    def _job():
-        delay = base_delay
-        for i in range(1, attempts + 1):
-            try:
-                email_send(subject, message, to_email)
-                return
-            except Exception as e:
-                log.error("email_send error try=%s: %s", i, e)
-                if i == attempts:
-                    return
-                time.sleep(delay)
-                delay *= 2
-    _spawn(_job)
-
-# ---------- создание заказа ----------
-
-@receiver(post_save, sender=Order, weak=False, dispatch_uid="order_created_once")
-def order_created_once(sender, instance: Order, created: bool, **kwargs):
-    if not created:
-        return
-
-    key_base = f"notify:order:{instance.pk}:created"
-
-    def _admins():
-        tg_send_to_admins(format_admin_new_order(instance))
-
-    def _client_email():
-        if not instance.email:
-            return
+    if order.email:
         # Без разрыва после приветствия; двойной перенос после фразы про уточнение;
         # двойной перенос перед «Спасибо…»
         lines = [
-            f"Здравствуйте, {instance.name}!",
-            f"Ваша заявка #{instance.pk} успешно принята. Мы свяжемся с вами для уточнения деталей.",
+            f"Здравствуйте, {order.name}!",
+            f"Ваша заявка #{order.pk} успешно принята. Мы свяжемся с вами для уточнения деталей.",
             "",
-            f"Адрес забора: {instance.pickup_address}" if instance.pickup_address else "",
+            f"Адрес забора: {order.pickup_address}" if order.pickup_address else "",
             (
-                f"Дата/время забора: {format_dt(getattr(instance, 'pickup_time', None))}"
-                if getattr(instance, "pickup_time", None) else ""
+                f"Дата/время забора: {format_dt(getattr(order, 'pickup_time', None))}"
+                if getattr(order, "pickup_time", None) else ""
             ),
-            f"Адрес доставки: {instance.delivery_address}" if instance.delivery_address else "",
+            f"Адрес доставки: {order.delivery_address}" if order.delivery_address else "",
             (
-                f"Дата/время доставки: {format_dt(getattr(instance, 'delivery_time', None))}"
-                if getattr(instance, "delivery_time", None) else ""
+                f"Дата/время доставки: {format_dt(getattr(order, 'delivery_time', None))}"
+                if getattr(order, "delivery_time", None) else ""
             ),
             "",
             "",
             "Спасибо, что выбрали Drop & Delivery!",
         ]
         body = "\n".join([l for l in lines if l is not None])
-        email_send_async(f"Заявка №{instance.pk} принята", body, instance.email)
+        jobs.append(Job(key_base + ":client_email", "email", {
+            "subject": f"Заявка №{order.pk} принята",
+            "body": body,
+            "to": order.email,
+        }))
+    return jobs
+
+
+def order_status_jobs(order: Order, old_status: str) -> List[Job]:
+    new_status = order.status
+    key_base = f"notify:order:{order.pk}:status:{old_status}->{new_status}"
+    text = format_status_message(order, old_status)
+
+    # TG админам
+    jobs = [Job(key_base + ":admins", "tg_admins", {"text": text})]
+
+    # TG клиенту (воркер отметит last_client_status_notified, чтобы не слать повторно)
+    if getattr(order, "last_client_status_notified", None) != new_status:
+        jobs.append(Job(key_base + ":client_tg", "tg_client", {
+            "order_id": order.pk,
+            "text": text,
+            "status": new_status,
+        }))
+
+    # Email клиенту (RU) — двойной перенос перед «Спасибо…»
+    if order.email:
+        old_ru, new_ru = status_ru(old_status), status_ru(new_status)
+        lines = [
+            f"Здравствуйте, {order.name}!",
+            "",
+            "Статус вашего заказа изменился:",
+            f"{old_ru} → {new_ru}",
+            "",
+            (
+                f"Адрес забора: {order.pickup_address}"
+                if getattr(order, "pickup_address", "") else ""
+            ),
+            (
+                f"Дата/время забора: {format_dt(getattr(order, 'pickup_time', None))}"
+                if getattr(order, "pickup_time", None) else ""
+            ),
+            (
+                f"Адрес доставки: {order.delivery_address}"
+                if getattr(order, "delivery_address", "") else ""
+            ),
+            (
+                f"Дата/время доставки: {format_dt(getattr(order, 'delivery_time', None))}"
+                if getattr(order, "delivery_time", None) else ""
+            ),
+            "",
+            "",
+            "Спасибо, что выбрали Drop & Delivery!",
+        ]
+        body = "\n".join([l for l in lines if l is not None])
+        jobs.append(Job(key_base + ":client_email", "email", {
+            "subject": f"Заказ №{order.pk}: статус изменён",
+            "body": body,
+            "to": order.email,
+        }))
+    return jobs
 
-    transaction.on_commit(lambda: send_once(key_base + ":admins", _admins))
-    transaction.on_commit(lambda: send_once(key_base + ":client_email", _client_email))
+# ---------- создание заказа ----------
+
+@receiver(post_save, sender=Order, weak=False, dispatch_uid="order_created_once")
+def order_created_once(sender, instance: Order, created: bool, **kwargs):
+    if not created:
+        return
+    with logs.bind(order_id=instance.pk):
+        enqueue_many(order_created_jobs(instance))
 
 # ---------- изменение статуса ----------
 
 @receiver(pre_save, sender=Order, weak=False, dispatch_uid="order_status_changed_once")
 def order_status_changed_once(sender, instance: Order, **kwargs):
+    # Здесь только запоминаем переход; в очередь он попадёт в post_save,
+    # когда UPDATE уже выполнен в той же транзакции.
+    instance._status_change = None
     if not instance.pk:
         return
 
-    try:
-        old_status = sender.objects.only("status").get(pk=instance.pk).status
-    except sender.DoesNotExist:
+    # save(update_fields=[...]) без status — статус точно не меняется
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and "status" not in update_fields:
         return
 
+    # статус, запомненный при загрузке (Order.from_db); SELECT — только если его нет
+    old_status = getattr(instance, "_loaded_status", None)
+    if old_status is None:
+        try:
+            old_status = sender.objects.only("status").get(pk=instance.pk).status
+        except sender.DoesNotExist:
+            return
+
     new_status = instance.status
     if old_status == new_status:
         return
 
-    key_base = f"notify:order:{instance.pk}:status:{old_status}->{new_status}"
-    log.warning("pre_save fired: id=%s %s -> %s", instance.pk, old_status, new_status)
-
-    def _after_commit():
-        # TG админам
-        send_once(
-            key_base + ":admins",
-            lambda: tg_send_to_admins(format_status_message(instance, old_status)),
-        )
-
-        # TG клиенту (и отметка в модели, чтобы не слать повторно)
-        if getattr(instance, "last_client_status_notified", None) != new_status:
-            def _client_tg():
-                ok, *_ = send_status_update(instance, old_status)
-                if ok:
-                    type(instance).objects.filter(pk=instance.pk).update(
-                        last_client_status_notified=new_status
-                    )
-            send_once(key_base + ":client_tg", _client_tg)
-
-        # Email клиенту (RU) — двойной перенос перед «Спасибо…»
-        if instance.email:
-            old_ru, new_ru = status_ru(old_status), status_ru(new_status)
-            lines = [
-                f"Здравствуйте, {instance.name}!",
-                "",
-                "Статус вашего заказа изменился:",
-                f"{old_ru} → {new_ru}",
-                "",
-                (
-                    f"Адрес забора: {instance.pickup_address}"
-                    if getattr(instance, "pickup_address", "") else ""
-                ),
-                (
-                    f"Дата/время забора: {format_dt(getattr(instance, 'pickup_time', None))}"
-                    if getattr(instance, "pickup_time", None) else ""
-                ),
-                (
-                    f"Адрес доставки: {instance.delivery_address}"
-                    if getattr(instance, "delivery_address", "") else ""
-                ),
-                (
-                    f"Дата/время доставки: {format_dt(getattr(instance, 'delivery_time', None))}"
-                    if getattr(instance, "delivery_time", None) else ""
-                ),
-                "",
-                "",
-                "Спасибо, что выбрали Drop & Delivery!",
-            ]
-            body = "\n".join([l for l in lines if l is not None])
-            send_once(
-                key_base + ":client_email",
-                lambda: email_send_async(
-                    f"Заказ №{instance.pk}: статус изменён",
-                    body,
-                    instance.email,
-                ),
-            )
-
-    transaction.on_commit(_after_commit)
+    with logs.bind(order_id=instance.pk):
+        log.info("order status: %s -> %s", old_status, new_status)
+    instance._status_change = old_status
+
+
+@receiver(post_save, sender=Order, weak=False, dispatch_uid="order_status_enqueue")
+def order_status_enqueue(sender, instance: Order, created: bool, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if update_fields is None or "status" in update_fields:
+        instance._loaded_status = instance.status
+    old_status = getattr(instance, "_status_change", None)
+    if created or old_status is None:
+        return
+    instance._status_change = None
+    with logs.bind(order_id=instance.pk):
+        enqueue_many(order_status_jobs(instance, old_status))
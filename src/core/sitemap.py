@@ -0,0 +1,122 @@
+"""
+sitemap.xml, собранный из реестра URL и словарей хабов.
+
+Страницы берутся из именованных маршрутов без параметров (кроме служебных)
+плюс все /aero/<code>/ и /station/<code>/ из AEROPORTS/STATIONS — ссылки
+не расходятся с тем, что сайт реально отдаёт. Готовые байты (XML и gzip)
+живут в памяти процесса и на диске до следующего деплоя.
+"""
+import gzip
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import List, NamedTuple, Tuple
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.urls import URLPattern, get_resolver, reverse
+
+from .pagecache import deploy_version
+from .stations import AEROPORTS, STATIONS
+
+# Маршруты, которым не место в sitemap
+EXCLUDED = {"robots", "sitemap", "sitemap_gz", "telegram_webhook", "link_chat", "metrics"}
+
+# changefreq/priority по имени маршрута; остальным — DEFAULT
+PAGES = {
+    "index": ("daily", "1.0"),
+    "delivery_moscow": ("weekly", "0.9"),
+    "storage_moscow": ("weekly", "0.9"),
+    "order_create": ("weekly", "0.9"),
+    "kamera_hraneniya_bagazha_moskva": ("weekly", "0.8"),
+    "luggage_storage_moscow": ("weekly", "0.8"),
+    "where_to_leave_luggage": ("weekly", "0.7"),
+    "faq": ("monthly", "0.8"),
+    "benefits": ("monthly", "0.8"),
+    "concept": ("monthly", "0.7"),
+    "contacts": ("monthly", "0.6"),
+    "offer": ("yearly", "0.4"),
+    "privacy": ("yearly", "0.3"),
+}
+DEFAULT = ("weekly", "0.5")
+HUBS = {
+    "aero": (AEROPORTS, "weekly", "0.9"),
+    "station": (STATIONS, "weekly", "0.8"),
+}
+
+
+class Entry(NamedTuple):
+    path: str
+    changefreq: str
+    priority: str
+
+
+def _named_routes() -> List[str]:
+    names = []
+    for p in get_resolver().url_patterns:
+        if not isinstance(p, URLPattern) or not p.name or p.name in EXCLUDED:
+            continue
+        if p.pattern.regex.groups:  # маршруты с параметрами — только через HUBS
+            continue
+        names.append(p.name)
+    return names
+
+
+def entries() -> List[Entry]:
+    out = []
+    for name in _named_routes():
+        out.append(Entry(reverse(name), *PAGES.get(name, DEFAULT)))
+    for route, (items, changefreq, priority) in HUBS.items():
+        for code in items:
+            out.append(Entry(reverse(route, args=[code]), changefreq, priority))
+    return out
+
+
+def render_xml() -> bytes:
+    base = getattr(settings, "SITE_URL", "").rstrip("/")
+    lastmod = datetime.fromtimestamp(deploy_version()[1], tz=timezone.utc).strftime("%Y-%m-%d")
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+    ]
+    for e in entries():
+        lines += [
+            "  <url>",
+            f"    <loc>{escape(base + e.path)}</loc>",
+            f"    <lastmod>{lastmod}</lastmod>",
+            f"    <changefreq>{e.changefreq}</changefreq>",
+            f"    <priority>{e.priority}</priority>",
+            "  </url>",
+        ]
+    lines.append("</urlset>")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _cache_dir() -> Path:
+    return Path(getattr(settings, "SITEMAP_CACHE_DIR", Path(settings.BASE_DIR) / ".cache"))
+
+
+@lru_cache(maxsize=1)
+def _built(version: str) -> Tuple[bytes, bytes, str]:
+    path = _cache_dir() / f"sitemap-{version}.xml.gz"
+    try:
+        gz = path.read_bytes()
+        xml = gzip.decompress(gz)
+    except (OSError, EOFError):
+        xml = render_xml()
+        gz = gzip.compress(xml, compresslevel=9, mtime=0)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(gz)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # диск только для чтения — хватит и памяти
+    return xml, gz, '"%s"' % hashlib.md5(xml).hexdigest()
+
+
+def get_sitemap() -> Tuple[bytes, bytes, str]:
+    """(xml, xml.gz, etag) для текущей версии деплоя."""
+    return _built(deploy_version()[0])
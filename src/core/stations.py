@@ -56,3 +56,35 @@ STATIONS = {
         "note": ""
     },
 }
+
+AEROPORTS = {
+    # код: все формы названия + синонимы для SEO/redirect и терминалы
+    "svo": {
+        "title": "Шереметьево",
+        "name_prep": "в Шереметьево",     # предл. падеж «в …»
+        "name_gen":  "из Шереметьево",    # родит. падеж «из …»
+        "synonyms":  ["svo", "шереметьево", "sheremetyevo", "шереметьева"],
+        "terminals": ["B", "C", "D", "E", "F"]
+    },
+    "dme": {
+        "title": "Домодедово",
+        "name_prep": "в Домодедово",
+        "name_gen":  "из Домодедово",
+        "synonyms":  ["dme", "домодедово", "domodedovo", "домодедова"],
+        "terminals": ["Терминал 1"]
+    },
+    "vko": {
+        "title": "Внуково",
+        "name_prep": "в Внуково",
+        "name_gen":  "из Внуково",
+        "synonyms":  ["vko", "внуково", "vnukovo", "внукова"],
+        "terminals": ["A", "B", "C"]
+    },
+    "zia": {
+        "title": "Жуковский",
+        "name_prep": "в Жуковский",
+        "name_gen":  "из Жуковского",
+        "synonyms":  ["zia", "жуко́вский", "zhukovsky", "жуковский", "жуковского"],
+        "terminals": ["Терминал"]
+    },
+}
@@ -0,0 +1,289 @@
+"""
+Хранилище статики: WhiteNoise (хэши + gzip/brotli) плюс адаптивные картинки.
+
+Сжатие кэшируется по содержимому: gzip/brotli-версии лежат в
+STATIC_COMPRESS_CACHE_DIR под sha256 исходника, так что неизменившиеся файлы
+между деплоями не пережимаются. Итог по каждому файлу (сколько байт сэкономили)
+пишется в compression.json рядом с манифестом — его печатает static_report.
+Если шаблон ссылается через {% static %} на файл, которого нет в манифесте,
+collectstatic падает.
+
+После обычного post_process крупные PNG/JPEG (от RESPONSIVE_IMAGE_MIN_BYTES)
+пережимаются в AVIF/WebP нескольких ширин. Варианты попадают в staticfiles.json
+как обычная статика (с хэшем в имени и вечным кэшем), а их список с размерами
+исходника — в images.json рядом с манифестом; его читает тег {% picture %}.
+
+Pillow необязателен: без него collectstatic работает как раньше, а тег
+выводит обычный <img>. AVIF — только если Pillow собран с его поддержкой.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+from whitenoise.compress import Compressor
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from .pagecache import _project_template_dirs
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    from PIL import Image, features
+except ImportError:  # pragma: no cover
+    Image = None
+
+log = logging.getLogger(__name__)
+
+IMAGES_MANIFEST = "images.json"
+COMPRESSION_REPORT = "compression.json"
+SOURCE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+# {% static "..." %} и наши {% picture "..." %}/{% preload_picture "..." %} в шаблонах
+_TEMPLATE_REF = re.compile(r"""{%\s*(?:static|picture|preload_picture)\s+["']([^"']+)["']""")
+# формат -> (параметры Pillow, MIME для <source type>)
+FORMATS = {
+    "avif": ({"quality": 55, "speed": 6}, "image/avif"),
+    "webp": ({"quality": 80, "method": 6}, "image/webp"),
+}
+
+
+def _available_formats():
+    if Image is None:
+        return []
+    wanted = getattr(settings, "RESPONSIVE_IMAGE_FORMATS", ("avif", "webp"))
+    return [f for f in wanted if f in FORMATS and features.check(f)]
+
+
+class CachedCompressor(Compressor):
+    """
+    Compressor WhiteNoise с кэшем по sha256 содержимого и явным уровнем brotli.
+    Неэффективное сжатие (> 95% исходника) тоже кэшируется — пустым файлом.
+    """
+
+    def __init__(self, *args, cache_dir: Path, root: str, brotli_quality: int = 11, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_dir = cache_dir
+        self.root = root
+        self.brotli_quality = brotli_quality
+        self.stats = []  # по файлу: name, size, br, gz, cached
+        self.used = set()
+        self._lock = threading.Lock()
+
+    def compress_brotli(self, data):
+        return brotli.compress(data, quality=self.brotli_quality)
+
+    def _cache_path(self, digest: str, suffix: str) -> Path:
+        if suffix == ".br":
+            suffix = f".q{self.brotli_quality}.br"
+        return self.cache_dir / digest[:2] / f"{digest}{suffix}"
+
+    def _compressed(self, digest: str, suffix: str, data: bytes):
+        cache_path = self._cache_path(digest, suffix)
+        with self._lock:
+            self.used.add(cache_path)
+        try:
+            return cache_path.read_bytes(), True
+        except OSError:
+            pass
+        out = self.compress_brotli(data) if suffix == ".br" else self.compress_gzip(data)
+        if not data or len(out) / len(data) > 0.95:
+            out = b""
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(out)
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            log.warning("static compress cache: %s", e)
+        return out, False
+
+    def compress(self, path):
+        with open(path, "rb") as f:
+            stat_result = os.fstat(f.fileno())
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        filenames = []
+        row = {"name": path[len(self.root):].lstrip(os.sep).replace(os.sep, "/"), "size": len(data), "cached": True}
+        for suffix, enabled in ((".br", self.use_brotli), (".gz", self.use_gzip)):
+            if not enabled:
+                continue
+            out, cached = self._compressed(digest, suffix, data)
+            row["cached"] = row["cached"] and cached
+            if out:
+                filenames.append(self.write_data(path, out, suffix, stat_result))
+                row[suffix[1:]] = len(out)
+        with self._lock:
+            self.stats.append(row)
+        return filenames
+
+    def prune(self):
+        """Удалить из кэша всё, что не понадобилось в этой сборке."""
+        if not self.cache_dir.is_dir():
+            return
+        for path in self.cache_dir.glob("*/*"):
+            if path not in self.used and not path.name.startswith("tmp"):
+                path.unlink(missing_ok=True)
+
+
+class ResponsiveStaticFilesStorage(CompressedManifestStaticFilesStorage):
+
+    def create_compressor(self, **kwargs):
+        return CachedCompressor(
+            cache_dir=Path(getattr(settings, "STATIC_COMPRESS_CACHE_DIR", Path(settings.BASE_DIR) / ".cache" / "compress")),
+            root=str(self.location),
+            brotli_quality=getattr(settings, "STATIC_BROTLI_QUALITY", 11),
+            **kwargs,
+        )
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        yield from self._post_process_images(paths)
+        self._write_compression_report()
+        missing = self._missing_template_refs()
+        if missing:
+            yield "templates", None, ValueError(
+                "Templates reference static files missing from the manifest:\n  " + "\n  ".join(missing)
+            )
+
+    def _write_compression_report(self):
+        compressor = getattr(self, "compressor", None)
+        if not isinstance(compressor, CachedCompressor):
+            return
+        compressor.prune()
+        # WhiteNoise жмёт и name, и name.<hash>; в отчёт — только то, что реально отдаётся
+        served = set(self.hashed_files.values())
+        rows = sorted((r for r in compressor.stats if r["name"] in served), key=lambda r: r["name"])
+        self._save_json(COMPRESSION_REPORT, rows)
+        saved = sum(r["size"] - min(r.get("br", r["size"]), r.get("gz", r["size"])) for r in rows)
+        log.info(
+            "static compression: %d files, %d from cache, %d bytes saved",
+            len(rows), sum(r["cached"] for r in rows), saved,
+        )
+
+    def _missing_template_refs(self):
+        missing = set()
+        for directory in _project_template_dirs():
+            for path in directory.rglob("*.html"):
+                for ref in _TEMPLATE_REF.findall(path.read_text("utf-8", errors="replace")):
+                    if self.hash_key(self.clean_name(ref)) not in self.hashed_files:
+                        missing.add(f"{path.relative_to(directory)}: {ref}")
+        return sorted(missing)
+
+    def _save_json(self, name: str, payload):
+        content = ContentFile(json.dumps(payload, indent=1, sort_keys=True).encode())
+        if self.manifest_storage.exists(name):
+            self.manifest_storage.delete(name)
+        self.manifest_storage._save(name, content)
+
+    def _post_process_images(self, paths):
+        formats = _available_formats()
+        if not formats:
+            log.warning("responsive images: Pillow or codecs unavailable, variants skipped")
+            return
+
+        previous = self._read_images_manifest()
+        min_bytes = getattr(settings, "RESPONSIVE_IMAGE_MIN_BYTES", 100_000)
+        images = {}
+        for name in sorted(paths):
+            if PurePosixPath(name).suffix.lower() not in SOURCE_EXTENSIONS:
+                continue
+            if self.size(name) < min_bytes:
+                continue
+            entry = self._reuse(previous.get(name), name, formats)
+            if entry is None:
+                entry = self._build_variants(name, formats)
+            images[name] = entry
+            for variants in entry["formats"].values():
+                for _, variant, hashed in variants:
+                    self.hashed_files[self.hash_key(variant)] = hashed
+                    yield variant, hashed, True
+
+        if images:
+            self.save_manifest()
+        self._save_json(IMAGES_MANIFEST, images)
+
+    def _read_images_manifest(self) -> dict:
+        try:
+            with self.manifest_storage.open(IMAGES_MANIFEST) as f:
+                return json.loads(f.read().decode())
+        except (OSError, ValueError):
+            return {}
+
+    def _reuse(self, entry: Optional[dict], name: str, formats) -> Optional[dict]:
+        # исходник не менялся (тот же хэш) и файлы на месте — повторно не кодируем
+        if not entry or entry.get("source") != self.hashed_files.get(self.hash_key(name)):
+            return None
+        if sorted(entry.get("formats", {})) != sorted(formats):
+            return None
+        for variants in entry["formats"].values():
+            for _, variant, hashed in variants:
+                if not (self.exists(variant) and self.exists(hashed)):
+                    return None
+        return entry
+
+    def _build_variants(self, name: str, formats) -> dict:
+        with self.open(name) as f:
+            source = Image.open(io.BytesIO(f.read()))
+            source.load()
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA" if "transparency" in source.info else "RGB")
+        width, height = source.size
+
+        widths = getattr(settings, "RESPONSIVE_IMAGE_WIDTHS", (480, 768, 1024))
+        widths = sorted({w for w in widths if w < width} | {width})
+
+        path = PurePosixPath(name)
+        entry = {
+            "source": self.hashed_files.get(self.hash_key(name)),
+            "width": width,
+            "height": height,
+            "formats": {},
+        }
+        for fmt in formats:
+            params, _ = FORMATS[fmt]
+            variants = []
+            for w in widths:
+                img = source if w == width else source.resize((w, round(height * w / width)), Image.LANCZOS)
+                buf = io.BytesIO()
+                img.save(buf, fmt.upper(), **params)
+                content = ContentFile(buf.getvalue())
+                variant = str(path.with_name(f"{path.stem}-{w}w.{fmt}"))
+                hashed = self.hashed_name(variant, content)
+                for target in (variant, hashed):
+                    if self.exists(target):
+                        self.delete(target)
+                    self._save(target, content)
+                variants.append([w, variant, hashed])
+            entry["formats"][fmt] = variants
+        log.info("responsive images: %s -> %s", name, ", ".join(entry["formats"]))
+        return entry
+
+
+@lru_cache(maxsize=1)
+def images_manifest() -> Dict[str, dict]:
+    """Содержимое images.json; пусто, если collectstatic ещё не запускался."""
+    manifest_storage = getattr(staticfiles_storage, "manifest_storage", None)
+    if manifest_storage is None:
+        return {}
+    try:
+        with manifest_storage.open(IMAGES_MANIFEST) as f:
+            return json.loads(f.read().decode())
+    except (OSError, ValueError):
+        return {}
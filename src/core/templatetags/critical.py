@@ -0,0 +1,29 @@
+"""
+{% stylesheets "<семейство>" %} — CDN-стили base.html.
+
+Есть critical CSS семейства (см. build_critical_css) — он инлайнится, а полные
+файлы подгружаются через preload без блокировки отрисовки. Нет — обычные <link>.
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from core.critical import STYLESHEETS, critical_css
+
+register = template.Library()
+
+
+@register.simple_tag
+def stylesheets(family="landing"):
+    css = critical_css(family)
+    if css is None:
+        return format_html_join("\n", '<link rel="stylesheet" href="{}">', ((url,) for url in STYLESHEETS))
+
+    deferred = format_html_join(
+        "\n",
+        '<link rel="preload" as="style" href="{0}" onload="this.onload=null;this.rel=\'stylesheet\'">'
+        '<noscript><link rel="stylesheet" href="{0}"></noscript>',
+        ((url,) for url in STYLESHEETS),
+    )
+    # css собран нашей же командой из CDN-стилей; </style> внутри не встречается
+    return format_html("<style>{}</style>\n{}", mark_safe(css.replace("</", "<\\/")), deferred)
@@ -0,0 +1,67 @@
+"""
+{% picture %} и {% preload_picture %} — адаптивные картинки из images.json.
+
+    {% load images %}
+    {% picture "core/img/dnd-hero.png" alt="..." sizes="(min-width: 992px) 420px, 100vw" class="img-fluid" %}
+
+Если вариантов нет (Pillow не установлен, collectstatic не запускался) —
+обычный <img> на исходный файл.
+"""
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from core.storage import FORMATS, images_manifest
+
+register = template.Library()
+
+DEFAULT_SIZES = "100vw"
+
+
+def _srcset(variants) -> str:
+    return ", ".join(f"{static(variant)} {w}w" for w, variant, _ in variants)
+
+
+@register.simple_tag
+def picture(src, alt="", sizes=DEFAULT_SIZES, loading="lazy", **attrs):
+    """<picture> с AVIF/WebP-источниками; width/height — от исходника (без прыжков вёрстки)."""
+    entry = images_manifest().get(src)
+    attrs.setdefault("decoding", "async")
+    if loading:
+        attrs["loading"] = loading
+    if entry:
+        attrs.setdefault("width", entry["width"])
+        attrs.setdefault("height", entry["height"])
+
+    img = format_html(
+        '<img src="{}" alt="{}"{}>',
+        static(src),
+        alt,
+        format_html_join("", ' {}="{}"', sorted(attrs.items())),
+    )
+    if not entry:
+        return img
+
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        ((FORMATS[fmt][1], _srcset(variants), sizes) for fmt, variants in entry["formats"].items()),
+    )
+    return format_html("<picture>{}{}</picture>", sources, img)
+
+
+@register.simple_tag
+def preload_picture(src, sizes=DEFAULT_SIZES):
+    """<link rel=preload> на первый (самый лёгкий) формат — для LCP-картинки в <head>."""
+    entry = images_manifest().get(src)
+    if not entry or not entry["formats"]:
+        return format_html(
+            '<link rel="preload" as="image" href="{}" fetchpriority="high">', static(src)
+        )
+    fmt, variants = next(iter(entry["formats"].items()))
+    return format_html(
+        '<link rel="preload" as="image" type="{}" imagesrcset="{}" imagesizes="{}" fetchpriority="high">',
+        FORMATS[fmt][1],
+        _srcset(variants),
+        sizes,
+    )
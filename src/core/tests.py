@@ -1,3 +1,1394 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import os
+import re
+import smtplib
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from urllib.parse import urlencode
+from unittest import mock, skipUnless
+from xml.etree import ElementTree
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.admin.views.main import ORDER_VAR
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail.backends import locmem
+from django.core.files.storage import FileSystemStorage
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core import critical, hubs, logs, mailer, notify, outbox, perf, profiler, search, sitemap, tg_client, views, warmup
+from core.changelist import EstimatedCountPaginator
+from core.middleware import PreloadLinkMiddleware, RequestIdMiddleware, StaticFilesMiddleware
+from core.models import ACTIVE, NotifyLock, NotifyOutbox, Order
+from core.pagecache import cached_page
+from core.storage import CachedCompressor, ResponsiveStaticFilesStorage
+from core.services import TransitionResult, bulk_transition_status
+from core.stations import AEROPORTS, STATIONS
+from core.utils import normalize_phone
+
+# Бюджет на импорт приложения в чистом процессе (сек); на медленном CI можно поднять переменной окружения
+IMPORT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", "2.0"))
+
+_IMPORT_SCRIPT = """
+import os, time
+started = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dandd.settings")
+import django
+django.setup()
+import dandd.urls
+from core import warmup
+warmup.run(["imports"])
+print(time.perf_counter() - started)
+"""
+
+
+def _slowest_imports(stderr: str, top: int = 15) -> str:
+    """Самые тяжёлые модули из вывода python -X importtime (cumulative, мкс)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|", 2))
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return "\n".join(f"{us / 1000:8.1f} ms  {name}" for us, name in rows[:top])
+
+
+class StartupBudgetTest(SimpleTestCase):
+    def test_import_time_within_budget(self):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _IMPORT_SCRIPT],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        elapsed = float(result.stdout.strip().splitlines()[-1])
+        self.assertLess(
+            elapsed,
+            IMPORT_BUDGET,
+            f"Импорт приложения занял {elapsed:.2f}s (бюджет {IMPORT_BUDGET}s). Самые тяжёлые модули:\n"
+            + _slowest_imports(result.stderr),
+        )
+
+
+class WorkerWarmupTest(SimpleTestCase):
+    def test_worker_phases(self):
+        self.assertEqual(warmup.worker_phases(preloaded=False, asgi=False), list(warmup.PHASES))
+        self.assertEqual(warmup.worker_phases(preloaded=True, asgi=False), ["db"])
+        self.assertEqual(warmup.worker_phases(preloaded=False, asgi=True), [p for p in warmup.PHASES if p != "db"])
+        # preload + ASGI: мастер прогрел всё, БД воркеру не нужна — греть нечего
+        self.assertEqual(warmup.worker_phases(preloaded=True, asgi=True), [])
+
+    def test_run_empty_runs_nothing(self):
+        with mock.patch.dict(warmup.PHASES, {name: mock.Mock() for name in warmup.PHASES}):
+            self.assertEqual(warmup.run([]), {})
+            for phase in warmup.PHASES.values():
+                phase.assert_not_called()
+
+
+ORDER_FIELDS = dict(
+    name="Иван Петров",
+    phone="+7 (999) 123-45-67",
+    email="ivan.petrov@mail.ru",
+    pickup_address="Тверская, 12",
+    delivery_address="Шереметьево, терминал B",
+)
+
+
+def _order(**kw):
+    return Order.objects.create(**{**ORDER_FIELDS, **kw})
+
+
+class AdminSearchTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(user)
+        self.order = _order()
+        self.other = _order(name="Мария", phone="+7 916 000-00-00", email="maria@example.com", pickup_address="Арбат, 1")
+
+    def search(self, term):
+        response = self.client.get(reverse("admin:core_order_changelist"), {"q": term})
+        self.assertEqual(response.status_code, 200)
+        return set(response.context["cl"].result_list)
+
+    def test_changelist_search(self):
+        for term in ("Иван", "Иван 999", "ivan.petrov@", "mail.ru", "123-45", str(self.order.pk)):
+            with self.subTest(term=term):
+                self.assertIn(self.order, self.search(term))
+        self.assertEqual(self.search("Иван 916"), set())
+
+    @skipUnless(connection.vendor == "postgresql", "tsvector-поиск только на PostgreSQL")
+    def test_ranked_search_ordering(self):
+        cl = self.client.get(reverse("admin:core_order_changelist"), {"q": "Иван"}).context["cl"]
+        self.assertEqual(list(cl.queryset.query.order_by), [f"-{search.RANK}", "-created_at", "-pk"])
+        # клик по колонке перекрывает релевантность
+        cl = self.client.get(reverse("admin:core_order_changelist"), {"q": "Иван", "o": "1"}).context["cl"]
+        self.assertNotIn(f"-{search.RANK}", cl.queryset.query.order_by)
+
+
+@override_settings(WHITENOISE_USE_FINDERS=True, WHITENOISE_AUTOREFRESH=False)
+class AsyncStaticFilesTest(SimpleTestCase):
+    path = "/static/core/img/" + sorted(os.listdir(Path(__file__).parent / "static" / "core" / "img"))[0]
+
+    async def test_static_served_in_async_mode(self):
+        async def view(request):
+            return HttpResponse("view")
+
+        middleware = StaticFilesMiddleware(view)
+        # иначе Django обернёт middleware в sync_to_async и запросы пойдут по одному
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        response = await middleware(RequestFactory().get(self.path))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response])
+        self.assertGreater(len(body), 0)
+
+        response = await middleware(RequestFactory().get("/"))
+        self.assertEqual(response.content, b"view")
+
+
+class AsyncMiddlewareChainTest(SimpleTestCase):
+    async def test_no_sync_only_middleware(self):
+        # одна sync-only middleware под ASGI сериализует все запросы процесса через один поток
+        for path in settings.MIDDLEWARE:
+            middleware = import_string(path)
+            if not getattr(middleware, "async_capable", False):
+                self.fail(f"{path} не поддерживает async")
+
+    async def test_preload_links_in_async_mode(self):
+        async def view(request):
+            return HttpResponse('<html><head><link rel="preload" href="/static/a.css" as="style"></head></html>')
+
+        middleware = PreloadLinkMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get("/"))
+        self.assertEqual(response["Link"], '</static/a.css>; rel="preload"; as="style"')
+
+
+@override_settings(ALLOWED_HOSTS=[".drop-delivery.ru", ".railway.app"], SITE_URL="https://www.drop-delivery.ru")
+class HubCacheTest(SimpleTestCase):
+    def setUp(self):
+        hubs._canonical_host.cache_clear()
+        self.addCleanup(hubs._canonical_host.cache_clear)
+        self.addCleanup(hubs._rendered.clear)
+        hubs._rendered.clear()
+
+    def test_only_canonical_host_is_kept_in_memory(self):
+        path = reverse("aero", args=[next(iter(hubs.AEROPORTS))])
+        for n in range(3):
+            response = self.client.get(path, HTTP_HOST=f"pr-{n}.up.railway.app")
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(hubs._rendered, {})
+
+        self.client.get(path, HTTP_HOST="www.drop-delivery.ru")
+        self.client.get(path, HTTP_HOST="www.drop-delivery.ru")
+        self.assertEqual(len(hubs._rendered), 1)
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.calls = []
+        handlers = mock.patch.dict(outbox.HANDLERS, {"test": self.handle})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+        self.error = None
+
+    def handle(self, payload):
+        self.calls.append(payload)
+        if self.error is not None:
+            raise self.error
+
+    def enqueue(self, key="k1", payload=None):
+        return outbox.enqueue(key, "test", payload or {"n": 1})
+
+    def drain(self):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            return outbox.drain(pool)
+
+    def drain_failing(self):
+        with self.assertLogs("core.outbox", "WARNING"):
+            return self.drain()
+
+    def test_enqueue_skips_duplicate_key(self):
+        self.assertTrue(self.enqueue())
+        self.assertFalse(self.enqueue())
+        self.assertEqual(NotifyOutbox.objects.filter(key="k1").count(), 1)
+
+    def test_claim_batch_takes_due_jobs_once(self):
+        self.enqueue("k1")
+        self.enqueue("k2")
+        self.enqueue("later")
+        NotifyOutbox.objects.filter(key="later").update(next_attempt_at=timezone.now() + timedelta(hours=1))
+
+        jobs = outbox.claim_batch(10)
+        self.assertEqual(sorted(j.key for j in jobs), ["k1", "k2"])
+        self.assertEqual({j.attempts for j in jobs}, {1})
+        self.assertEqual(NotifyOutbox.objects.get(key="k1").state, NotifyOutbox.State.PROCESSING)
+        # аренда ещё не истекла — повторно не забираются
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_sent(self):
+        self.enqueue()
+        self.assertEqual(self.drain(), {"claimed": 1, "sent": 1, "pending": 0, "dead": 0})
+        self.assertEqual(self.calls, [{"n": 1}])
+        self.assertEqual(NotifyOutbox.objects.get().state, NotifyOutbox.State.SENT)
+
+    def test_retry_with_backoff_and_new_payload(self):
+        self.enqueue()
+        self.error = outbox.DeliveryError("timeout", payload={"n": 2})
+        before = timezone.now()
+        self.assertEqual(self.drain_failing()["pending"], 1)
+
+        job = NotifyOutbox.objects.get()
+        self.assertEqual(job.state, NotifyOutbox.State.PENDING)
+        self.assertEqual(job.last_error, "timeout")
+        self.assertEqual(job.payload, {"n": 2})
+        self.assertGreaterEqual(job.next_attempt_at, before + outbox._backoff(1))
+
+    @override_settings(NOTIFY_OUTBOX_BACKOFF=5, NOTIFY_OUTBOX_BACKOFF_MAX=30)
+    def test_backoff_doubles_up_to_cap(self):
+        self.assertEqual([outbox._backoff(n).total_seconds() for n in range(1, 6)], [5, 10, 20, 30, 30])
+
+    def test_permanent_error_is_dead(self):
+        self.enqueue()
+        self.error = outbox.DeliveryError("chat not found", permanent=True)
+        self.assertEqual(self.drain_failing()["dead"], 1)
+        self.assertEqual(NotifyOutbox.objects.get().state, NotifyOutbox.State.DEAD)
+
+    @override_settings(NOTIFY_OUTBOX_MAX_ATTEMPTS=2)
+    def test_dead_after_max_attempts(self):
+        self.enqueue()
+        self.error = RuntimeError("boom")
+        self.assertEqual(self.drain_failing()["pending"], 1)
+        NotifyOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.drain_failing()["dead"], 1)
+        job = NotifyOutbox.objects.get()
+        self.assertEqual((job.state, job.attempts), (NotifyOutbox.State.DEAD, 2))
+
+    def test_notify_worker_once(self):
+        self.enqueue()
+        out = StringIO()
+        with mock.patch("signal.signal"):
+            call_command("notify_worker", "--once", stdout=out)
+        self.assertIn("claimed=1 sent=1", out.getvalue())
+        self.assertEqual(NotifyOutbox.objects.get().state, NotifyOutbox.State.SENT)
+
+    def test_order_not_saved_without_notifications(self):
+        # заказ и его уведомления — одна транзакция
+        with mock.patch("core.signals.enqueue_many", side_effect=DatabaseError("outbox down")):
+            with self.assertRaises(DatabaseError):
+                views._create_order(Order(**ORDER_FIELDS))
+        self.assertFalse(Order.objects.exists())
+
+    def test_chat_not_linked_without_welcome(self):
+        order = _order()
+        with mock.patch("core.views.enqueue", side_effect=DatabaseError("outbox down")):
+            with self.assertRaises(DatabaseError):
+                views._link_order_chat(order, 12345)
+        order.refresh_from_db()
+        self.assertIsNone(order.telegram_chat_id)
+
+    def test_welcome_goes_to_chat_from_payload(self):
+        order = _order(telegram_chat_id="111")
+        views._link_order_chat(order, 222)
+        Order.objects.filter(pk=order.pk).update(telegram_chat_id="333")  # перепривязали до отправки
+        job = NotifyOutbox.objects.get(kind="tg_welcome")
+        with mock.patch("core.notify.tg_send", return_value=(True, 200, "")) as send:
+            outbox.HANDLERS["tg_welcome"](job.payload)
+        self.assertEqual(send.call_args.args[1], "222")
+
+
+def _tg_response(status, body):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode()
+    return response
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="t", TELEGRAM_RATE_LIMIT=0, TELEGRAM_RETRY_AFTER_MAX=10)
+class TelegramClientTest(SimpleTestCase):
+    def setUp(self):
+        self.session = mock.Mock()
+        for target, value in (("get_session", mock.Mock(return_value=self.session)), ("time", mock.Mock())):
+            patcher = mock.patch.object(tg_client, target, value)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+    def test_429_within_cap_is_retried(self):
+        self.session.post.side_effect = [
+            _tg_response(429, {"ok": False, "parameters": {"retry_after": 3}}),
+            _tg_response(200, {"ok": True}),
+        ]
+        with self.assertLogs("core.tg_client", "WARNING"):
+            ok, status, _ = tg_client.send_message(1, "hi")
+        self.assertEqual((ok, status), (True, 200))
+        self.assertEqual(self.session.post.call_count, 2)
+        tg_client.time.sleep.assert_called_once_with(3.0)
+
+    def test_429_over_cap_is_not_retried(self):
+        self.session.post.return_value = _tg_response(429, {"ok": False, "parameters": {"retry_after": 60}})
+        ok, status, _ = tg_client.send_message(1, "hi")
+        self.assertEqual((ok, status), (False, 429))
+        self.assertEqual(self.session.post.call_count, 1)
+        tg_client.time.sleep.assert_not_called()
+
+    def test_timeout_is_returned_not_raised(self):
+        self.session.post.side_effect = requests.Timeout("read timed out")
+        ok, status, body = tg_client.send_message(1, "hi")
+        self.assertEqual((ok, status), (False, 0))
+        self.assertIn("read timed out", body)
+
+    def test_rate_limiter_spaces_calls(self):
+        tg_client.time.monotonic.return_value = 100.0
+        limiter = tg_client._RateLimiter()
+        limiter.wait(10)
+        tg_client.time.sleep.assert_not_called()
+        limiter.wait(10)
+        limiter.wait(10)
+        self.assertEqual([round(c.args[0], 3) for c in tg_client.time.sleep.call_args_list], [0.1, 0.2])
+
+
+@override_settings(TELEGRAM_CHAT_IDS=["1", "2", "3"])
+class AdminFanoutTest(TestCase):
+    def setUp(self):
+        self.sent = []
+        patcher = mock.patch.object(notify, "tg_send", side_effect=self.tg_send)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tg_send(self, text, chat_id):
+        self.sent.append(chat_id)
+        return (False, 502, "Bad Gateway") if chat_id == "2" else (True, 200, "{}")
+
+    def test_partial_failure(self):
+        with self.assertLogs("core.notify", "ERROR"):
+            result = notify.tg_send_to_admins("hi")
+        self.assertFalse(result)
+        self.assertEqual(result.failed, ["2"])
+        self.assertEqual([r.ok for r in result.results], [True, False, True])
+
+    def test_outbox_retries_only_failed_chats(self):
+        outbox.enqueue("admins", "tg_admins", {"text": "hi"})
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with self.assertLogs("core", "WARNING"):
+                self.assertEqual(outbox.drain(pool)["pending"], 1)
+            job = NotifyOutbox.objects.get()
+            self.assertEqual(job.payload, {"text": "hi", "chat_ids": ["2"]})
+
+            self.sent.clear()
+            NotifyOutbox.objects.update(next_attempt_at=timezone.now())
+            with self.assertLogs("core", "WARNING"):
+                outbox.drain(pool)
+        self.assertEqual(self.sent, ["2"])
+
+
+@override_settings(CACHES={
+    "default": {
+        "BACKEND": "core.cache.TieredCache",
+        "OPTIONS": {"LOCAL": "local", "SHARED": "shared", "LOCAL_TIMEOUT": 30},
+    },
+    "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-l1"},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-l2"},
+})
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache, self.local, self.shared = caches["default"], caches["local"], caches["shared"]
+        self.addCleanup(self.cache.clear)
+
+    def test_local_hit_skips_shared(self):
+        self.cache.set("k", "v")
+        self.shared.delete("k")
+        self.assertEqual(self.cache.get("k"), "v")
+
+    def test_shared_fallback_fills_local(self):
+        self.shared.set("k", "v")
+        self.assertEqual(self.cache.get("k"), "v")
+        self.assertEqual(self.local.get("k"), "v")
+        self.assertIsNone(self.cache.get("missing"))
+
+    def test_local_copy_expires(self):
+        self.cache.set("k", "v", timeout=300)
+        self.shared.set("k", "changed by another worker")
+        now = time.time()
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=now + 31):
+            self.assertIsNone(self.local.get("k"))
+            self.assertEqual(self.cache.get("k"), "changed by another worker")
+
+    def test_delete_and_add_use_both_tiers(self):
+        self.cache.set("k", "v")
+        self.cache.delete("k")
+        self.assertIsNone(self.local.get("k"))
+        self.assertIsNone(self.shared.get("k"))
+
+        self.assertTrue(self.cache.add("k", "v"))
+        self.assertEqual((self.local.get("k"), self.shared.get("k")), ("v", "v"))
+        self.assertFalse(self.cache.add("k", "other"))
+        # ключ, добавленный другим процессом только в L2, тоже не даёт add()
+        self.shared.set("k2", "v")
+        self.assertFalse(self.cache.add("k2", "other"))
+
+
+@override_settings(NOTIFY_LOCK_TTL_DAYS=90, NOTIFY_OUTBOX_RETENTION_DAYS=14)
+class PurgeNotifyLocksTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        old = now - timedelta(days=100)
+        for key in ("expired-1", "expired-2", "expired-3"):
+            NotifyLock.objects.create(key=key, expires_at=now - timedelta(days=1))
+        for key in ("legacy-1", "legacy-2", "legacy-recent"):
+            NotifyLock.objects.create(key=key, expires_at=None)
+        NotifyLock.objects.filter(key__in=["legacy-1", "legacy-2"]).update(created_at=old)
+        for key in ("live-1", "live-2"):
+            NotifyLock.objects.create(key=key, expires_at=now + timedelta(days=1))
+
+        State = NotifyOutbox.State
+        for key, state in (("old-sent", State.SENT), ("old-dead", State.DEAD), ("old-pending", State.PENDING), ("new-sent", State.SENT)):
+            NotifyOutbox.objects.create(key=key, kind="email", state=state)
+        NotifyOutbox.objects.exclude(key="new-sent").update(updated_at=now - timedelta(days=30))
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command("purge_notify_locks", "--chunk", "2", "--sleep", "0", *args, stdout=out)
+        return out.getvalue()
+
+    def test_deletes_only_stale_rows_in_chunks(self):
+        out = self.purge()
+        self.assertEqual(
+            sorted(NotifyLock.objects.values_list("key", flat=True)), ["legacy-recent", "live-1", "live-2"]
+        )
+        self.assertEqual(sorted(NotifyOutbox.objects.values_list("key", flat=True)), ["new-sent", "old-pending"])
+        self.assertIn(f"{NotifyLock._meta.db_table}: deleted=5", out)
+        self.assertIn(f"{NotifyOutbox._meta.db_table}: deleted=2", out)
+
+    def test_dry_run_deletes_nothing(self):
+        out = self.purge("--dry-run")
+        self.assertEqual(NotifyLock.objects.count(), 8)
+        self.assertEqual(NotifyOutbox.objects.count(), 4)
+        self.assertIn("would delete 5", out)
+        self.assertIn("would delete 2", out)
+
+
+class ClaimLocksTest(TestCase):
+    def test_only_new_keys_are_claimed(self):
+        self.assertEqual(notify.claim_locks(["a", "b", "b"]), {"a", "b"})
+        self.assertEqual(notify.claim_locks(["b", "c", "a", "d"]), {"c", "d"})
+        self.assertEqual(notify.claim_locks([]), set())
+        self.assertEqual(NotifyLock.objects.count(), 4)
+
+    def test_single_insert_statement(self):
+        NotifyLock.objects.create(key="a")
+        with self.assertNumQueries(1):
+            notify.claim_locks(["a", "b", "c"])
+
+    @override_settings(NOTIFY_LOCK_TTL_DAYS=7)
+    def test_expires_at(self):
+        before = timezone.now()
+        notify.claim_locks(["default-ttl"])
+        notify.claim_locks(["short"], ttl=timedelta(hours=1))
+        after = timezone.now()
+        default_ttl = NotifyLock.objects.get(key="default-ttl").expires_at
+        short = NotifyLock.objects.get(key="short").expires_at
+        self.assertTrue(before + timedelta(days=7) <= default_ttl <= after + timedelta(days=7))
+        self.assertTrue(before + timedelta(hours=1) <= short <= after + timedelta(hours=1))
+
+    def test_fallback_without_on_conflict(self):
+        # СУБД без INSERT … ON CONFLICT … RETURNING: по одному ключу в savepoint
+        NotifyLock.objects.create(key="a")
+        with mock.patch.object(notify, "_upsert_supported", return_value=False):
+            self.assertEqual(notify.claim_locks(["a", "b", "c"], ttl=timedelta(days=1)), {"b", "c"})
+            self.assertEqual(notify.claim_locks(["c", "d"]), {"d"})
+        self.assertEqual(NotifyLock.objects.count(), 4)
+        self.assertIsNotNone(NotifyLock.objects.get(key="b").expires_at)
+
+
+class LoadedStatusTest(TestCase):
+    def setUp(self):
+        self.order = _order()
+        NotifyOutbox.objects.all().delete()
+
+    def status_selects(self, queries):
+        table = Order._meta.db_table
+        return [q["sql"] for q in queries if q["sql"].startswith("SELECT") and f'FROM "{table}"' in q["sql"]]
+
+    def test_loaded_order_saves_without_select(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = Order.Status.CONFIRMED
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        self.assertEqual(self.status_selects(ctx.captured_queries), [])
+        self.assertTrue(NotifyOutbox.objects.filter(key__contains="draft->confirmed").exists())
+
+        # следующий переход сравнивается уже с сохранённым статусом
+        order.status = Order.Status.PICKED_UP
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        self.assertEqual(self.status_selects(ctx.captured_queries), [])
+        self.assertTrue(NotifyOutbox.objects.filter(key__contains="confirmed->picked_up").exists())
+
+    def test_update_fields_without_status_skips_check(self):
+        order = Order(pk=self.order.pk, name="Пётр")
+        with self.assertNumQueries(1):
+            order.save(update_fields=["name"])
+        self.assertFalse(NotifyOutbox.objects.exists())
+
+    def test_hand_built_order_still_notifies(self):
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = Order.Status.CONFIRMED
+        with CaptureQueriesContext(connection) as ctx:
+            order.save()
+        loaded_queries = len(ctx.captured_queries)
+        NotifyOutbox.objects.all().delete()
+        NotifyLock.objects.all().delete()
+        Order.objects.filter(pk=order.pk).update(status=Order.Status.DRAFT)
+
+        built = Order.objects.values().get(pk=order.pk)
+        built = Order(**{**built, "status": Order.Status.CONFIRMED})
+        # статус не загружался — один SELECT, чтобы узнать старый
+        with self.assertNumQueries(loaded_queries + 1):
+            built.save()
+        self.assertTrue(NotifyOutbox.objects.filter(key__contains="draft->confirmed").exists())
+
+
+class BulkTransitionTest(TestCase):
+    def setUp(self):
+        self.orders = [_order(name=f"Клиент {n}") for n in range(4)]
+        self.orders[0].status = Order.Status.CONFIRMED
+        self.orders[0].save()
+        NotifyOutbox.objects.all().delete()
+
+    def test_result_and_one_set_of_jobs_per_changed_order(self):
+        result = bulk_transition_status(Order.objects.all(), Order.Status.CONFIRMED)
+        self.assertEqual(result, TransitionResult(changed=3, enqueued=9))
+        self.assertEqual(set(Order.objects.values_list("status", flat=True)), {Order.Status.CONFIRMED})
+
+        # уже подтверждённая заявка пропущена; на каждую изменённую — админы, клиент в TG, письмо
+        kinds = {}
+        for key, kind in NotifyOutbox.objects.values_list("key", "kind"):
+            order_id = int(key.split(":")[2])
+            kinds.setdefault(order_id, []).append(kind)
+        self.assertEqual(set(kinds), {o.pk for o in self.orders[1:]})
+        for order_kinds in kinds.values():
+            self.assertEqual(sorted(order_kinds), ["email", "tg_admins", "tg_client"])
+
+        # повтор ничего не меняет и не шлёт дважды
+        self.assertEqual(bulk_transition_status(Order.objects.all(), Order.Status.CONFIRMED), TransitionResult())
+        self.assertEqual(NotifyOutbox.objects.count(), 9)
+
+    def test_query_count_does_not_depend_on_size(self):
+        with CaptureQueriesContext(connection) as one:
+            bulk_transition_status(Order.objects.filter(pk=self.orders[1].pk), Order.Status.IN_STORAGE)
+        with self.assertNumQueries(len(one.captured_queries)):
+            bulk_transition_status(Order.objects.all(), Order.Status.DELIVERED)
+
+    def test_admin_action_message(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse("admin:core_order_changelist"),
+            {"action": "mark_confirmed", ACTION_CHECKBOX_NAME: [o.pk for o in self.orders]},
+            follow=True,
+        )
+        messages = [str(m) for m in response.context["messages"]]
+        self.assertEqual(messages, ["Статус изменён: 3, уведомлений в очереди: 9"])
+
+
+class NormalizePhoneTest(SimpleTestCase):
+    def test_rules(self):
+        cases = [
+            ("+7 (999) 123-45-67", "79991234567"),
+            ("8 999 123 45 67", "79991234567"),
+            ("89991234567", "79991234567"),
+            ("9991234567", "79991234567"),
+            ("7-999-123-45-67", "79991234567"),
+            ("+44 20 7946 0958", "442079460958"),
+            ("+7 999 123-45-67 доб. 123", "79991234567123"),   # длинный номер не обрезается
+            ("8 800 123", "8800123"),                           # короткий — как есть
+            ("", ""),
+            (None, ""),
+        ]
+        for raw, expected in cases:
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_phone(raw), expected)
+
+
+@override_settings(TELEGRAM_SHARED_TOKEN="secret")
+class LinkChatTest(TestCase):
+    def setUp(self):
+        self.order = _order(phone="8 (999) 123-45-67", email="Ivan.Petrov@Mail.RU")
+        NotifyOutbox.objects.all().delete()
+
+    def test_normalized_fields_follow_update_fields(self):
+        self.assertEqual((self.order.phone_digits, self.order.email_lower), ("79991234567", "ivan.petrov@mail.ru"))
+        self.order.phone = "+7 916 000-00-00"
+        self.order.email = "New@Example.com"
+        self.order.save(update_fields=["phone", "email"])
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.phone_digits, self.order.email_lower), ("79160000000", "new@example.com"))
+
+    def link(self, **data):
+        request = RequestFactory().post(
+            "/api/link_chat/", json.dumps(data), content_type="application/json", HTTP_X_TG_TOKEN="secret"
+        )
+        return views.LinkChatView.as_view()(request)
+
+    def test_found_by_differently_formatted_phone(self):
+        response = self.link(chat_id=555, phone="+7 999 1234567")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["order_id"], self.order.pk)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.telegram_chat_id, "555")
+        self.assertTrue(NotifyOutbox.objects.filter(kind="tg_welcome").exists())
+
+    def test_found_by_email_case_insensitive(self):
+        self.assertEqual(self.link(chat_id=555, email=" ivan.petrov@mail.ru ").status_code, 200)
+
+    def test_not_found(self):
+        self.assertEqual(self.link(chat_id=555, phone="+7 916 000-00-00").status_code, 404)
+
+    async def test_async_view(self):
+        request = RequestFactory().post(
+            "/api/link_chat/", json.dumps({"chat_id": 777, "phone": "9991234567"}),
+            content_type="application/json", HTTP_X_TG_TOKEN="secret",
+        )
+        response = await views.link_chat(request)
+        self.assertEqual(json.loads(response.content), {"success": True, "order_id": self.order.pk})
+
+
+@override_settings(
+    PAGE_CACHE_ENABLED=True,
+    PAGE_CACHE_ALIAS="pages",
+    ALLOWED_HOSTS=["testserver", "other.example"],
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-default"},
+        "pages": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "test-pages"},
+    },
+)
+class CachedPageTest(SimpleTestCase):
+    def setUp(self):
+        self.calls = 0
+        self.factory = RequestFactory()
+        self.addCleanup(lambda: caches["pages"].clear())
+
+    def view(self, request):
+        self.calls += 1
+        return HttpResponse(f"page {self.calls}")
+
+    def get(self, view=None, path="/offer/", **extra):
+        return cached_page(view or self.view)(self.factory.get(path, **extra))
+
+    def test_second_get_from_cache(self):
+        first = self.get()
+        second = self.get()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_if_none_match(self):
+        etag = self.get()["ETag"]
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.calls, 1)
+
+    def test_uncacheable_responses_not_stored(self):
+        def csrf_view(request):
+            get_token(request)
+            return self.view(request)
+
+        def cookie_view(request):
+            response = self.view(request)
+            response.set_cookie("seen", "1")
+            return response
+
+        def not_found_view(request):
+            self.calls += 1
+            return HttpResponse("missing", status=404)
+
+        for view in (csrf_view, cookie_view, not_found_view):
+            with self.subTest(view=view.__name__):
+                self.calls = 0
+                self.get(view)
+                self.get(view)
+                self.assertEqual(self.calls, 2)
+
+        self.calls = 0
+        self.get(path="/offer/?utm_source=x")
+        self.get(path="/offer/?utm_source=x")
+        self.assertEqual(self.calls, 2)
+
+    def test_key_separates_host_and_scheme(self):
+        self.get()
+        self.get(HTTP_HOST="other.example")
+        self.get(secure=True)
+        self.assertEqual(self.calls, 3)
+        self.get(HTTP_HOST="other.example")
+        self.assertEqual(self.calls, 3)
+
+    @override_settings(DEBUG=True)
+    def test_nothing_cached_under_debug(self):
+        self.get()
+        self.get()
+        self.assertEqual(self.calls, 2)
+
+
+class SitemapTest(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(SITEMAP_CACHE_DIR=Path(tmp.name), SITE_URL="https://www.drop-delivery.ru")
+        override.enable()
+        self.addCleanup(override.disable)
+        sitemap._built.cache_clear()
+        self.addCleanup(sitemap._built.cache_clear)
+
+    def locs(self, xml: bytes):
+        root = ElementTree.fromstring(xml)
+        ns = {"s": "http://www.sitemaps.org/schemas/sitemap/0.9"}
+        return {loc.text for loc in root.iterfind("s:url/s:loc", ns)}
+
+    def test_hubs_included_service_routes_excluded(self):
+        response = self.client.get(reverse("sitemap"))
+        self.assertEqual(response.status_code, 200)
+        locs = self.locs(response.content)
+        base = "https://www.drop-delivery.ru"
+        for route, items in (("aero", AEROPORTS), ("station", STATIONS)):
+            for code in items:
+                self.assertIn(base + reverse(route, args=[code]), locs)
+        self.assertIn(base + reverse("index"), locs)
+        for name in sitemap.EXCLUDED:
+            try:
+                path = reverse(name)
+            except NoReverseMatch:
+                continue
+            self.assertNotIn(base + path, locs)
+
+    def test_if_none_match(self):
+        etag = self.client.get(reverse("sitemap"))["ETag"]
+        response = self.client.get(reverse("sitemap"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_gz(self):
+        response = self.client.get(reverse("sitemap_gz"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-gzip")
+        self.assertEqual(gzip.decompress(response.content), sitemap.get_sitemap()[0])
+
+
+HERO = "core/img/dnd-hero.png"
+HERO_ENTRY = {
+    "source": "core/img/dnd-hero.abc123.png",
+    "width": 1200,
+    "height": 800,
+    "formats": {
+        "avif": [[600, "core/img/dnd-hero-600w.avif", "x"], [1200, "core/img/dnd-hero-1200w.avif", "y"]],
+        "webp": [[600, "core/img/dnd-hero-600w.webp", "z"], [1200, "core/img/dnd-hero-1200w.webp", "w"]],
+    },
+}
+
+
+@override_settings(STORAGES={
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+class PictureTagTest(SimpleTestCase):
+    def render(self, source, manifest):
+        with mock.patch("core.templatetags.images.images_manifest", return_value=manifest):
+            return Template("{% load images %}" + source).render(Context())
+
+    def test_picture_sources_and_dimensions(self):
+        html = self.render(
+            '{% picture "core/img/dnd-hero.png" alt="hero" sizes="50vw" loading="eager" fetchpriority="high" %}',
+            {HERO: HERO_ENTRY},
+        )
+        self.assertTrue(html.startswith("<picture>"))
+        self.assertInHTML(
+            '<source type="image/avif" sizes="50vw" srcset="/static/core/img/dnd-hero-600w.avif 600w, '
+            '/static/core/img/dnd-hero-1200w.avif 1200w">',
+            html,
+        )
+        self.assertIn('<source type="image/webp"', html)
+        self.assertLess(html.index("image/avif"), html.index("image/webp"))
+        self.assertInHTML(
+            '<img src="/static/core/img/dnd-hero.png" alt="hero" decoding="async" fetchpriority="high" '
+            'height="800" loading="eager" width="1200">',
+            html,
+        )
+
+    def test_default_is_lazy(self):
+        html = self.render('{% picture "core/img/dnd-hero.png" %}', {HERO: HERO_ENTRY})
+        self.assertIn('loading="lazy"', html)
+
+    def test_fallback_without_images_json(self):
+        html = self.render('{% picture "core/img/dnd-hero.png" alt="hero" %}', {})
+        self.assertNotIn("<picture>", html)
+        self.assertNotIn("<source", html)
+        self.assertNotIn("width=", html)
+        self.assertInHTML(
+            '<img src="/static/core/img/dnd-hero.png" alt="hero" decoding="async" loading="lazy">', html
+        )
+
+    def test_preload(self):
+        html = self.render('{% preload_picture "core/img/dnd-hero.png" sizes="50vw" %}', {HERO: HERO_ENTRY})
+        self.assertInHTML(
+            '<link rel="preload" as="image" type="image/avif" imagesizes="50vw" fetchpriority="high" '
+            'imagesrcset="/static/core/img/dnd-hero-600w.avif 600w, /static/core/img/dnd-hero-1200w.avif 1200w">',
+            html,
+        )
+        html = self.render('{% preload_picture "core/img/dnd-hero.png" %}', {})
+        self.assertInHTML(
+            '<link rel="preload" as="image" href="/static/core/img/dnd-hero.png" fetchpriority="high">', html
+        )
+
+    def test_hub_hero_is_eager(self):
+        code = next(iter(AEROPORTS))
+        with mock.patch("core.templatetags.images.images_manifest", return_value={HERO: HERO_ENTRY}):
+            html = self.client.get(reverse("aero", args=[code])).content.decode()
+        self.assertIn('<link rel="preload" as="image" type="image/avif"', html)
+        self.assertIn('fetchpriority="high" height="800" loading="eager"', html)
+
+
+@override_settings(STORAGES={
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+})
+class CriticalCssTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        override = override_settings(CRITICAL_CSS_DIR=self.dir / "critical", SITE_URL="https://testserver")
+        override.enable()
+        self.addCleanup(override.disable)
+        critical.critical_css.cache_clear()
+        self.addCleanup(critical.critical_css.cache_clear)
+
+    def render(self, family):
+        return Template('{% load critical %}{% stylesheets "' + family + '" %}').render(Context())
+
+    def build(self):
+        bootstrap, icons = self.dir / "bootstrap.css", self.dir / "icons.css"
+        bootstrap.write_text("body{margin:0}.container{width:100%}.never-used-class{color:red}", "utf-8")
+        icons.write_text(".bi{display:inline-block}", "utf-8")
+        bootstrap_url, icons_url = critical.CRITICAL_SOURCES
+        call_command(
+            "build_critical_css",
+            "--css", f"{bootstrap_url}={bootstrap}",
+            "--css", f"{icons_url}={icons}",
+            stdout=StringIO(),
+        )
+
+    def test_blocking_links_without_file(self):
+        html = self.render("hub")
+        self.assertNotIn("<style>", html)
+        for url in critical.STYLESHEETS:
+            self.assertInHTML(f'<link rel="stylesheet" href="{url}">', html)
+
+    def test_build_and_inline(self):
+        self.build()
+        for family in critical.FAMILIES:
+            css = (self.dir / "critical" / f"{family}.css").read_text("utf-8")
+            self.assertIn("body{margin:0}", css)
+            self.assertNotIn("never-used-class", css)
+
+        # ссылка на Google Fonts содержит &, в атрибуте он экранирован
+        html = self.render("hub").replace("&amp;", "&")
+        self.assertTrue(html.startswith("<style>body{margin:0}"))
+        for url in critical.STYLESHEETS:
+            self.assertIn(
+                f'<link rel="preload" as="style" href="{url}" '
+                "onload=\"this.onload=null;this.rel='stylesheet'\">"
+                f'<noscript><link rel="stylesheet" href="{url}"></noscript>',
+                html,
+            )
+        self.assertEqual(html.count('<link rel="stylesheet"'), len(critical.STYLESHEETS))
+
+    def test_style_close_tag_escaped(self):
+        (self.dir / "critical").mkdir()
+        (self.dir / "critical" / "landing.css").write_text('a::after{content:"</style>"}', "utf-8")
+        html = self.render("landing")
+        self.assertEqual(html.count("</style>"), 1)
+
+
+class StaticCompressionTest(SimpleTestCase):
+    CSS = b"body{margin:0}\n" * 500
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        (self.dir / "src").mkdir()
+        (self.dir / "src" / "app.css").write_bytes(self.CSS)
+        (self.dir / "templates").mkdir()
+        override = override_settings(
+            STATIC_COMPRESS_CACHE_DIR=self.dir / "cache", STATIC_BROTLI_QUALITY=1, RESPONSIVE_IMAGE_FORMATS=(),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch("core.storage._project_template_dirs", return_value=[self.dir / "templates"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def collect(self):
+        """То же, что делает collectstatic: копия в STATIC_ROOT и post_process; возвращает ошибки."""
+        root = self.dir / "root"
+        storage = ResponsiveStaticFilesStorage(location=root, base_url="/static/")
+        if storage.exists("app.css"):
+            storage.delete("app.css")
+        source = FileSystemStorage(self.dir / "src")
+        with source.open("app.css") as f:
+            storage.save("app.css", f)
+        paths = {"app.css": (source, "app.css")}
+        with self.assertLogs("core.storage", "INFO"):
+            errors = [processed for _, _, processed in storage.post_process(paths) if isinstance(processed, Exception)]
+        return storage, errors
+
+    def test_compressor_cache_hit(self):
+        path = self.dir / "src" / "app.css"
+        first = CachedCompressor(cache_dir=self.dir / "cache", root=str(self.dir / "src"), brotli_quality=1, quiet=True)
+        first.compress(str(path))
+        self.assertFalse(first.stats[0]["cached"])
+        gz = path.with_name("app.css.gz").read_bytes()
+
+        second = CachedCompressor(cache_dir=self.dir / "cache", root=str(self.dir / "src"), brotli_quality=1, quiet=True)
+        with mock.patch.object(second, "compress_gzip") as compress_gzip:
+            second.compress(str(path))
+        compress_gzip.assert_not_called()
+        self.assertTrue(second.stats[0]["cached"])
+        self.assertEqual(second.stats[0]["name"], "app.css")
+        self.assertEqual(path.with_name("app.css.gz").read_bytes(), gz)
+        self.assertEqual(gzip.decompress(gz), self.CSS)
+
+    def test_second_collect_is_cache_hit(self):
+        storage, errors = self.collect()
+        self.assertEqual(errors, [])
+        # app.css и app.<hash>.css одинаковы и жмутся параллельно: промах хотя бы один
+        self.assertFalse(all(row["cached"] for row in storage.compressor.stats))
+
+        storage, errors = self.collect()
+        self.assertEqual(errors, [])
+        self.assertTrue(all(row["cached"] for row in storage.compressor.stats))
+        with storage.manifest_storage.open("compression.json") as f:
+            report = json.loads(f.read())
+        self.assertEqual([row["name"] for row in report], [storage.hashed_files["app.css"]])
+
+    def test_missing_template_reference_fails(self):
+        (self.dir / "templates" / "ok.html").write_text('{% load static %}{% static "app.css" %}', "utf-8")
+        (self.dir / "templates" / "broken.html").write_text('{% picture "img/nope.png" %}', "utf-8")
+        _, errors = self.collect()
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], ValueError)
+        self.assertIn("broken.html: img/nope.png", str(errors[0]))
+        self.assertNotIn("ok.html", str(errors[0]))
+
+
+SERVER_TIMING = re.compile(r'^app;dur=\d+\.\d(, db;dur=\d+\.\d;desc="\d+ queries")?(, [\w-]+;dur=\d+\.\d)*$')
+
+
+@override_settings(PERF_METRICS_ENABLED=True, PERF_SERVER_TIMING=False, PERF_METRICS_TOKEN="metrics-secret")
+class ServerTimingTest(TestCase):
+    def test_hidden_from_anonymous(self):
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Server-Timing", response)
+
+    def test_with_token(self):
+        response = self.client.get(reverse("index"), HTTP_AUTHORIZATION="Bearer metrics-secret")
+        self.assertRegex(response["Server-Timing"], SERVER_TIMING)
+        response = self.client.get(reverse("index"), HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertNotIn("Server-Timing", response)
+
+    def test_staff(self):
+        user = get_user_model().objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(user)
+        self.assertRegex(self.client.get(reverse("index"))["Server-Timing"], SERVER_TIMING)
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    def test_enabled_for_everyone(self):
+        self.assertRegex(self.client.get(reverse("index"))["Server-Timing"], SERVER_TIMING)
+
+    def test_format(self):
+        stats = perf.RequestStats()
+        stats.db_count, stats.db_time = 3, 0.0125
+        stats.outbound = {"telegram": 0.2, "sendgrid": 0.05}
+        self.assertEqual(
+            perf.server_timing(stats, 0.25),
+            'app;dur=250.0, db;dur=12.5;desc="3 queries", sendgrid;dur=50.0, telegram;dur=200.0',
+        )
+        self.assertRegex(perf.server_timing(stats, 0.25), SERVER_TIMING)
+
+
+@override_settings(DEBUG=False, PERF_METRICS_ENABLED=True)
+class MetricsEndpointTest(SimpleTestCase):
+    @override_settings(PERF_METRICS_TOKEN="")
+    def test_404_without_token_setting(self):
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+    @override_settings(PERF_METRICS_TOKEN="metrics-secret")
+    def test_403_without_bearer(self):
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(PERF_METRICS_TOKEN="metrics-secret")
+    def test_200_with_bearer(self):
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer metrics-secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+
+@override_settings(PROFILER_SAMPLE_RATE=0.0, PROFILER_TOKEN_MAX_AGE=3600, PROFILER_INTERVAL=0.001)
+class ProfilerTest(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name) / "profiles"
+        override = override_settings(PROFILER_DIR=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.factory = RequestFactory()
+
+    def request(self, token=None):
+        headers = {profiler.HEADER: token} if token else {}
+        return self.factory.get("/", headers=headers)
+
+    def test_token(self):
+        token = profiler.make_token()
+        self.assertTrue(profiler.should_profile(self.request(token)))
+        self.assertFalse(profiler.should_profile(self.request(token[:-1] + ("A" if token[-1] != "A" else "B"))))
+        self.assertFalse(profiler.should_profile(self.request("profile:garbage")))
+        with mock.patch("django.core.signing.time.time", return_value=time.time() + 3601):
+            self.assertFalse(profiler.should_profile(self.request(token)))
+
+    def test_sample_rate(self):
+        self.assertFalse(profiler.should_profile(self.request()))
+        with override_settings(PROFILER_SAMPLE_RATE=1.0):
+            self.assertTrue(profiler.should_profile(self.request()))
+
+    def test_save_writes_collapsed_stacks(self):
+        sampler = profiler.start()
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        path = profiler.save(sampler, "order_create", "POST")
+        self.assertEqual(path.parent, self.dir)
+        self.assertIn("-POST-order-create-", path.name)
+        lines = path.read_text("utf-8").splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r"^\S.* \d+$")
+        self.assertTrue(any("test_save_writes_collapsed_stacks" in line for line in lines))
+
+    def test_middleware(self):
+        with mock.patch.object(profiler, "start", wraps=profiler.start) as start:
+            self.assertEqual(self.client.get(reverse("index")).status_code, 200)
+            start.assert_not_called()
+            self.assertFalse(self.dir.exists())
+
+            self.client.get(reverse("index"), headers={profiler.HEADER: "profile:1abc:forged"})
+            start.assert_not_called()
+
+            self.client.get(reverse("index"), headers={profiler.HEADER: profiler.make_token()})
+            start.assert_called_once()
+
+
+class LogsTest(SimpleTestCase):
+    def record(self, msg="hello %s", args=("world",), exc_info=None, **extra):
+        record = logging.LogRecord("core.test", logging.WARNING, __file__, 1, msg, args, exc_info)
+        record.__dict__.update(extra)
+        logs.ContextFilter().filter(record)
+        return record
+
+    def test_json_formatter(self):
+        token = logs.bind_request("req-1")
+        try:
+            with logs.bind(key="notify:order:42:welcome"):
+                record = self.record(chat_id=5, payload={"a": 1})
+        finally:
+            logs.unbind_request(token)
+        data = json.loads(logs.JsonFormatter().format(record))
+        self.assertEqual(data["level"], "WARNING")
+        self.assertEqual(data["logger"], "core.test")
+        self.assertEqual(data["msg"], "hello world")
+        self.assertEqual(data["request_id"], "req-1")
+        self.assertEqual(data["order_id"], "42")
+        self.assertEqual(data["chat_id"], 5)
+        self.assertEqual(data["payload"], "{'a': 1}")
+        self.assertRegex(data["ts"], r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d$")
+        self.assertNotIn("exc", data)
+
+    def test_json_formatter_without_context(self):
+        data = json.loads(logs.JsonFormatter().format(self.record()))
+        self.assertNotIn("request_id", data)
+        self.assertNotIn("order_id", data)
+
+    def test_exception_survives_queue(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = self.record(exc_info=sys.exc_info())
+        prepared = logs._QueueHandler(None).prepare(record)
+        self.assertIsNone(prepared.exc_info)
+        self.assertEqual(prepared.msg, "hello world")
+        data = json.loads(logs.JsonFormatter().format(prepared))
+        self.assertIn("ValueError: boom", data["exc"])
+
+    def test_request_id_middleware(self):
+        seen = []
+
+        def view(request):
+            seen.append(self.record().request_id)
+            return HttpResponse("ok")
+
+        middleware = RequestIdMiddleware(view)
+        factory = RequestFactory()
+
+        response = middleware(factory.get("/", headers={"X-Request-ID": "edge-abc.123"}))
+        self.assertEqual(response["X-Request-ID"], "edge-abc.123")
+        self.assertEqual(seen[-1], "edge-abc.123")
+
+        for incoming in (None, "bad id; drop table", "x" * 65):
+            headers = {"X-Request-ID": incoming} if incoming else {}
+            response = middleware(factory.get("/", headers=headers))
+            self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{16}$")
+            self.assertEqual(seen[-1], response["X-Request-ID"])
+        # после запроса контекст очищен
+        self.assertIsNone(self.record().request_id)
+
+    def test_request_id_middleware_async(self):
+        async def view(request):
+            return HttpResponse(self.record().request_id)
+
+        middleware = RequestIdMiddleware(view)
+        response = async_to_sync(middleware)(RequestFactory().get("/", headers={"X-Request-ID": "edge-1"}))
+        self.assertEqual(response["X-Request-ID"], "edge-1")
+        self.assertEqual(response.content, b"edge-1")
+
+    @override_settings(LOG_PAYLOAD_MAX_CHARS=10)
+    def test_truncate(self):
+        self.assertEqual(logs.truncate("short"), "short")
+        self.assertEqual(logs.truncate("x" * 25), "x" * 10 + "…(+15 chars)")
+        self.assertEqual(logs.truncate({"имя": 1}, limit=100), '{"имя": 1}')
+        self.assertEqual(logs.truncate("abcdef", limit=3), "abc…(+3 chars)")
+
+    def test_sampled(self):
+        with override_settings(LOG_PAYLOAD_SAMPLE_RATE=0.0):
+            self.assertFalse(logs.sampled())
+        with override_settings(LOG_PAYLOAD_SAMPLE_RATE=1.0):
+            self.assertTrue(logs.sampled())
+        with override_settings(LOG_PAYLOAD_SAMPLE_RATE=0.5):
+            with mock.patch("core.logs.random.random", return_value=0.4):
+                self.assertTrue(logs.sampled())
+            with mock.patch("core.logs.random.random", return_value=0.6):
+                self.assertFalse(logs.sampled())
+
+
+class OrderChangeListTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(user)
+        base = timezone.now().replace(microsecond=0)
+        orders = [_order(name=f"Клиент {i}") for i in range(8)]
+        # при 3 строках на страницу одинаковые created_at (минута 3) разрезаны границей страниц 2 и 3
+        stamps = [0, 1, 1, 2, 3, 3, 3, 4]
+        for order, minutes in zip(orders, stamps):
+            Order.objects.filter(pk=order.pk).update(created_at=base - timedelta(minutes=minutes))
+        self.expected = list(Order.objects.order_by("-created_at", "-pk").values_list("pk", flat=True))
+        patcher = mock.patch.object(admin.site._registry[Order], "list_per_page", 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = reverse("admin:core_order_changelist")
+
+    def changelist(self, query=""):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_keyset_pages_without_gaps_or_duplicates(self):
+        seen, query, pages = [], "", 0
+        while True:
+            cl = self.changelist(query)
+            seen += [order.pk for order in cl.result_list]
+            pages += 1
+            if not cl.next_page_url:
+                break
+            self.assertIn("after=", cl.next_page_url)
+            query = cl.next_page_url
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(pages, 3)
+
+    def test_cursor_with_tied_created_at(self):
+        third = Order.objects.get(pk=self.expected[2])
+        cl = self.changelist("?" + urlencode({"after": f"{third.created_at.isoformat()},{third.pk}"}))
+        self.assertEqual([o.pk for o in cl.result_list], self.expected[3:6])
+
+    def test_malformed_cursor_falls_back_to_pages(self):
+        for value in ("garbage", "2024-01-01T00:00:00", "2024-01-01T00:00:00,abc", "not-a-date,5"):
+            with self.subTest(after=value):
+                cl = self.changelist("?" + urlencode({"after": value}))
+                self.assertIsNone(cl.cursor)
+                self.assertEqual([o.pk for o in cl.result_list], self.expected[:3])
+
+    def test_sorting_drops_cursor(self):
+        first = Order.objects.get(pk=self.expected[0])
+        cursor = f"{first.created_at.isoformat()},{first.pk}"
+        cl = self.changelist("?" + urlencode({"after": cursor, "o": "1"}))
+        self.assertIsNone(cl.cursor)
+        self.assertIsNone(cl.next_page_url)
+        self.assertEqual([o.pk for o in cl.result_list], sorted(self.expected)[:3])
+
+        cl = self.changelist("?" + urlencode({"after": cursor}))
+        self.assertIsNotNone(cl.cursor)
+        self.assertNotIn("after=", cl.get_query_string({ORDER_VAR: "2"}))
+        self.assertNotIn("after=", cl.get_query_string({"status__exact": "new"}))
+
+    def test_exact_count_below_threshold(self):
+        with override_settings(ADMIN_ESTIMATED_COUNT_OVER=10000):
+            with mock.patch("core.changelist.estimated_count", return_value=9999):
+                paginator = EstimatedCountPaginator(Order.objects.all(), 3)
+                self.assertEqual(paginator.count, 8)
+                self.assertFalse(paginator.estimated)
+            with mock.patch("core.changelist.estimated_count", return_value=20000):
+                paginator = EstimatedCountPaginator(Order.objects.all(), 3)
+                self.assertEqual(paginator.count, 20000)
+                self.assertTrue(paginator.estimated)
+        # не PostgreSQL — оценки нет, всегда точный COUNT
+        if connection.vendor != "postgresql":
+            paginator = EstimatedCountPaginator(Order.objects.all(), 3)
+            self.assertEqual(paginator.count, 8)
+            self.assertFalse(paginator.estimated)
+
+
+class ExplainQueriesTest(TestCase):
+    def test_smoke(self):
+        _order()
+        out = StringIO()
+        call_command("explain_queries", stdout=out)
+        output = out.getvalue()
+        for name in ("active_by_pickup", "status_newest", "changelist", "changelist_keyset", "link_chat",
+                     "public_token", "outbox_due"):
+            self.assertIn(f"== {name}:", output)
+        self.assertIn("core_order_created_at", output)
+
+    def test_selected_and_unknown(self):
+        out = StringIO()
+        call_command("explain_queries", "link_chat", stdout=out)
+        self.assertIn("== link_chat:", out.getvalue())
+        self.assertNotIn("== changelist:", out.getvalue())
+        with self.assertRaisesMessage(CommandError, "неизвестные запросы: nope"):
+            call_command("explain_queries", "nope", stdout=StringIO())
+
+    @skipUnless(connection.vendor != "postgresql", "ANALYZE есть только на PostgreSQL")
+    def test_analyze_requires_postgres(self):
+        with self.assertRaises(CommandError):
+            call_command("explain_queries", "--analyze", stdout=StringIO())
+
+    def test_active_matches_partial_index(self):
+        index = next(i for i in Order._meta.indexes if i.name == "core_order_active_pickup_idx")
+        self.assertEqual(index.condition, ACTIVE)
+        self.assertEqual(str(Order.objects.active().query), str(Order.objects.filter(index.condition).query))
+        # условие ссылается на настоящие статусы, а не на устаревшие строки
+        self.assertLessEqual({"delivered", "canceled"}, set(Order.Status.values))
+
+        kept = {status: _order(status=status) for status in Order.Status.values}
+        active = set(Order.objects.active().values_list("status", flat=True))
+        self.assertEqual(active, set(kept) - {"delivered", "canceled"})
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """locmem, который отказывает адресам bad@… — как SMTP с RCPT TO 550."""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(r.startswith("bad@") for r in message.recipients()):
+                raise smtplib.SMTPRecipientsRefused({r: (550, b"no such user") for r in message.recipients()})
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="core.tests.FlakyEmailBackend", EMAIL_CONNECTION_MAX_IDLE=60)
+class MailerTest(TestCase):
+    def setUp(self):
+        mailer.close()
+        self.addCleanup(mailer.close)
+        patcher = mock.patch("core.mailer.get_connection", wraps=mailer.get_connection)
+        self.get_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def message(self, to):
+        return notify.build_email("Заявка", "Текст", to)
+
+    def test_one_connection_per_batch(self):
+        errors = mailer.send([self.message(f"c{i}@example.com") for i in range(3)])
+        self.assertEqual(errors, [None, None, None])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(self.get_connection.call_count, 1)
+        # и следующая пачка идёт через то же соединение
+        mailer.send([self.message("c3@example.com")])
+        self.assertEqual(self.get_connection.call_count, 1)
+
+    def test_failure_is_per_message_and_reopens(self):
+        errors = mailer.send([self.message("a@example.com"), self.message("bad@example.com"), self.message("b@example.com")])
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], smtplib.SMTPRecipientsRefused)
+        self.assertIsNone(errors[2])
+        self.assertEqual([m.to for m in mail.outbox], [["a@example.com"], ["b@example.com"]])
+        # после ошибки соединение закрыто, следующее письмо открыло новое
+        self.assertEqual(self.get_connection.call_count, 2)
+
+    def test_reopen_after_idle(self):
+        with mock.patch("core.mailer.time.monotonic") as monotonic:
+            monotonic.return_value = 1000.0
+            mailer.send([self.message("a@example.com")])
+            first = mailer._connection
+            monotonic.return_value = 1059.0
+            mailer.send([self.message("b@example.com")])
+            self.assertIs(mailer._connection, first)
+            # простой считается от последнего письма, а не от открытия
+            monotonic.return_value = 1059.0 + 61
+            with mock.patch.object(first, "close", wraps=first.close) as close:
+                mailer.send([self.message("c@example.com")])
+            close.assert_called_once()
+            self.assertIsNot(mailer._connection, first)
+        self.assertEqual(self.get_connection.call_count, 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_drain_marks_neighbours_sent(self):
+        for i, to in enumerate(["a@example.com", "bad@example.com", "b@example.com"]):
+            outbox.enqueue(f"mail:{i}", "email", {"to": to, "subject": "Заявка", "body": "Текст"})
+        with ThreadPoolExecutor(max_workers=2) as pool, self.assertLogs("core.outbox", "INFO") as logged:
+            stats = outbox.drain(pool)
+        self.assertEqual(stats, {"claimed": 3, "sent": 2, "pending": 1, "dead": 0})
+        self.assertIn("email batch sent=2 failed=1", "\n".join(logged.output))
+        self.assertEqual(self.get_connection.call_count, 2)
+        jobs = {job.key: job for job in NotifyOutbox.objects.all()}
+        self.assertEqual(jobs["mail:0"].state, NotifyOutbox.State.SENT)
+        self.assertEqual(jobs["mail:2"].state, NotifyOutbox.State.SENT)
+        self.assertEqual(jobs["mail:1"].state, NotifyOutbox.State.PENDING)
+        self.assertIn("no such user", jobs["mail:1"].last_error)
+        self.assertEqual(jobs["mail:0"].last_error, "")
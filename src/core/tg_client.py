@@ -0,0 +1,128 @@
+"""
+Единый клиент Telegram Bot API.
+Один на процесс пул keep-alive соединений к api.telegram.org:
+рассылка нескольким чатам не платит за TCP/TLS-рукопожатие на каждое сообщение.
+"""
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from .perf import outbound
+
+log = logging.getLogger(__name__)
+
+API_BASE = "https://api.telegram.org"
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def get_session() -> requests.Session:
+    """Ленивая инициализация общего Session (потокобезопасно)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                # pool_block=True — не больше TELEGRAM_POOL_MAXSIZE соединений к хосту,
+                # лишние потоки ждут свободное, а не открывают новые
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=_setting("TELEGRAM_POOL_MAXSIZE", 10),
+                    pool_block=True,
+                )
+                s.mount(API_BASE, adapter)
+                _session = s
+    return _session
+
+
+class _RateLimiter:
+    """Равномерно раздаёт слоты: не больше rate запросов в секунду на процесс."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self, rate: float):
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1.0 / rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_limiter = _RateLimiter()
+
+
+def _timeout(timeout):
+    if timeout is not None:
+        return timeout
+    return (_setting("TELEGRAM_CONNECT_TIMEOUT", 3.05), _setting("TELEGRAM_READ_TIMEOUT", 10))
+
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    try:
+        return float(r.json().get("parameters", {}).get("retry_after"))
+    except Exception:
+        return None
+
+
+def call(method: str, data: dict, timeout=None) -> Tuple[bool, int, str]:
+    """
+    POST /bot<token>/<method>.
+    Возвращает (ok, http_status, body) — как раньше tg_send; исключения не пробрасывает.
+    На 429 ждёт retry_after (если он не больше TELEGRAM_RETRY_AFTER_MAX) и повторяет.
+    """
+    token = _setting("TELEGRAM_BOT_TOKEN", "")
+    if not token:
+        return (False, 0, "Missing token")
+
+    url = f"{API_BASE}/bot{token}/{method}"
+    retries = _setting("TELEGRAM_MAX_RETRIES", 2)
+    max_wait = _setting("TELEGRAM_RETRY_AFTER_MAX", 10)
+
+    attempt = 0
+    while True:
+        # Telegram режет бота примерно на 30 сообщений/с — держимся ниже
+        _limiter.wait(_setting("TELEGRAM_RATE_LIMIT", 25))
+        try:
+            with outbound("telegram"):
+                r = get_session().post(url, data=data, timeout=_timeout(timeout))
+        except Exception as e:
+            return (False, 0, f"Exception: {e}")
+
+        if r.status_code != 429 or attempt >= retries:
+            return (r.ok, r.status_code, r.text)
+
+        wait = _retry_after(r)
+        if wait is None or wait > max_wait:
+            return (r.ok, r.status_code, r.text)
+
+        attempt += 1
+        log.warning("telegram %s: 429, retry in %ss (attempt %s)", method, wait, attempt)
+        time.sleep(wait)
+
+
+def send_message(chat_id, text: str, parse_mode: Optional[str] = "HTML",
+                 disable_web_page_preview: Optional[bool] = True,
+                 timeout=None) -> Tuple[bool, int, str]:
+    if not chat_id:
+        return (False, 0, "Missing chat_id")
+    data = {"chat_id": str(chat_id), "text": text}
+    if parse_mode:
+        data["parse_mode"] = parse_mode
+    if disable_web_page_preview is not None:
+        data["disable_web_page_preview"] = disable_web_page_preview
+    return call("sendMessage", data, timeout=timeout)
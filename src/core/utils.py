@@ -1,12 +1,35 @@
-import requests
+import logging
+import re
+
 from django.conf import settings
-from django.core.mail import send_mail, get_connection, EmailMessage
+from django.core.mail import send_mail, EmailMessage
+
+from . import mailer, tg_client
+
+log = logging.getLogger(__name__)
 
 
 def _get(setting_name: str, default=None):
     return getattr(settings, setting_name, default)
 
 
+def normalize_phone(phone: str) -> str:
+    """
+    Телефон → только цифры в формате E.164 без «+» (RU: 8XXXXXXXXXX / 9XXXXXXXXX → 7XXXXXXXXXX).
+    Используется для индексируемого поиска заказа по телефону.
+    """
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    elif len(digits) == 10 and digits.startswith("9"):
+        digits = "7" + digits
+    return digits
+
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
 def notify_telegram_new_order(order):
     """
     Уведомление АДМИНУ в Telegram (в твой приватный чат).
@@ -29,18 +52,11 @@ def notify_telegram_new_order(order):
         f"Комментарий: {order.comment or '—'}"
     )
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    data = {
-        "chat_id": admin_chat_id,
-        "text": text,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": True,
-    }
-    try:
-        r = requests.post(url, data=data, timeout=5)
-        print("[TG admin] sent:", r.status_code, r.text[:200])
-    except Exception as e:
-        print(f"[TG admin] send failed: {e}")
+    ok, code, body = tg_client.send_message(admin_chat_id, text, timeout=5)
+    if ok:
+        log.info("tg admin: sent, status=%s", code)
+    else:
+        log.warning("tg admin: send failed, status=%s body=%s", code, body[:200])
 
 
 def build_telegram_deeplink(order):
@@ -65,14 +81,9 @@ def send_client_email(order):
         f"{build_telegram_deeplink(order)}\n\n"
         "— Команда Drop & Delivery"
     )
-    try:
-        # timeout работает для SMTP‑backend’а
-        conn = get_connection(timeout=5)
-        EmailMessage(
-            subject, body, settings.DEFAULT_FROM_EMAIL, [order.email], connection=conn
-        ).send(fail_silently=True)
-    except Exception as e:
-        print("[MAIL] send failed:", e)
+    (error,) = mailer.send([EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [order.email])])
+    if error is not None:
+        log.warning("client email: send failed: %s", error)
 
 
 def notify_client_telegram(order, text):
@@ -83,9 +94,8 @@ def notify_client_telegram(order, text):
     if not (token and order.telegram_chat_id):
         return
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    data = {"chat_id": order.telegram_chat_id, "text": text}
-    try:
-        requests.post(url, data=data, timeout=5)
-    except Exception as e:
-        print("[TG client] send failed:", e)
+    ok, code, body = tg_client.send_message(
+        order.telegram_chat_id, text, parse_mode=None, disable_web_page_preview=None, timeout=5
+    )
+    if not ok:
+        log.warning("tg client: send failed, status=%s body=%s", code, body[:200])
@@ -1,89 +1,35 @@
 import json
+import logging
 from uuid import UUID
-import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
 from django.http import HttpResponseForbidden, HttpResponse, JsonResponse
 from django.shortcuts import render
-from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from . import logs, perf
 from .forms import OrderForm
 from .models import Order
-from .notify import send_welcome
+from .outbox import enqueue
+from .pagecache import cached_page, conditional_page, deploy_version
 from .serializers import LinkChatSerializer
-from .utils import build_telegram_deeplink
-from .stations import STATIONS
+from .sitemap import get_sitemap
+from .utils import build_telegram_deeplink, normalize_email, normalize_phone
+from .hubs import render_hub
 
 from django.shortcuts import render, get_object_or_404
 from django.http import Http404
 
-AEROPORTS = {
-    # код: все формы названия + синонимы для SEO/redirect и терминалы
-    "svo": {
-        "title": "Шереметьево",
-        "name_prep": "в Шереметьево",     # предл. падеж «в …»
-        "name_gen":  "из Шереметьево",    # родит. падеж «из …»
-        "synonyms":  ["svo", "шереметьево", "sheremetyevo", "шереметьева"],
-        "terminals": ["B", "C", "D", "E", "F"]
-    },
-    "dme": {
-        "title": "Домодедово",
-        "name_prep": "в Домодедово",
-        "name_gen":  "из Домодедово",
-        "synonyms":  ["dme", "домодедово", "domodedovo", "домодедова"],
-        "terminals": ["Терминал 1"]
-    },
-    "vko": {
-        "title": "Внуково",
-        "name_prep": "в Внуково",
-        "name_gen":  "из Внуково",
-        "synonyms":  ["vko", "внуково", "vnukovo", "внукова"],
-        "terminals": ["A", "B", "C"]
-    },
-    "zia": {
-        "title": "Жуковский",
-        "name_prep": "в Жуковский",
-        "name_gen":  "из Жуковского",
-        "synonyms":  ["zia", "жуко́вский", "zhukovsky", "жуковский", "жуковского"],
-        "terminals": ["Терминал"]
-    },
-}
+log = logging.getLogger(__name__)
 
 def aero(request, code: str):
-    code = code.lower()
-    data = AEROPORTS.get(code)
-    if not data:
-        raise Http404()
-
-    # SEO
-    h1 = f"Доставка багажа {data['name_prep']} и {data['name_gen']} — Drop & Delivery"
-    title = f"Доставка багажа {data['name_prep']} / {data['name_gen']} — Drop & Delivery"
-    desc = (
-        f"Заберём у двери, упакуем и опечатаем, оформим акт и доставим {data['name_prep']} "
-        f"или {data['name_gen']} — точно ко времени. Первые сутки хранения включены."
-    )
-
-    canonical = request.build_absolute_uri(reverse("aero", args=[code]))
-
-    # Перелинковка: другие аэропорты + несколько вокзалов
-    nav_items = [(reverse("aero", args=[k]), f"Аэропорт: {v['title']}") for k, v in AEROPORTS.items() if k != code]
-    nav_items += [(reverse("station", args=[k]), f"Вокзал: {v['title']}") for k, v in list(STATIONS.items())[:6]]
-
-    ctx = {
-        "code": code,
-        "data": data,
-        "h1": h1,
-        "meta_title": title,
-        "meta_desc": desc,
-        "canonical": canonical,
-        "nav_items": nav_items,
-    }
-    return render(request, "core/hub.html", ctx)
-
+    return render_hub(request, "aero", code)
 
 
 def _client_ip(request):
@@ -93,30 +39,43 @@ def _client_ip(request):
     return request.META.get("REMOTE_ADDR")
 
 
+@cached_page
 def index(request):
     return render(request, "core/index.html")
 
 
+@cached_page
 def offer(request):
     return render(request, "core/offer.html")
 
 
+@cached_page
 def contacts(request):
     return render(request, "core/contacts.html")
 
 
+@cached_page
 def privacy(request):
     return render(request, "core/privacy.html")
 
 
+@cached_page
 def storage_moscow(request):
     return render(request, "core/storage_moscow.html")
 
+@cached_page
 def luggage_storage_moscow(request):
     return render(request, "core/luggage_storage_moscow.html")
 
 
-def order_create(request):
+def _create_order(order):
+    # INSERT и уведомления из post_save (outbox) — одной транзакцией:
+    # заказ без уведомлений или уведомления без заказа не остаются
+    with transaction.atomic():
+        order.save()
+
+
+async def order_create(request):
     if request.method == "POST":
         form = OrderForm(request.POST)
         if form.is_valid():
@@ -128,11 +87,13 @@ def order_create(request):
                 order.consent_ip = _client_ip(request)
                 order.consent_ua = request.META.get("HTTP_USER_AGENT", "")[:256]
 
-            order.save()  # TG и письмо клиенту уйдут из сигналов post_save
+            await sync_to_async(_create_order)(order)  # TG и письмо клиенту уйдут из сигналов post_save
+            log.info("order_create: order=%s created", order.pk)
             tg_link = build_telegram_deeplink(order)
             return render(request, "core/order_success.html", {"tg_link": tg_link})
         else:
-            print("OrderForm errors:", form.errors.as_json())
+            # только имена полей: значения — персональные данные
+            log.info("order_create: invalid form, fields=%s", sorted(form.errors))
     else:
         form = OrderForm()
 
@@ -140,7 +101,7 @@ def order_create(request):
 
 
 @csrf_exempt
-def telegram_webhook(request, secret: str):
+async def telegram_webhook(request, secret: str):
     if secret != getattr(settings, "TELEGRAM_WEBHOOK_SECRET", ""):
         return HttpResponseForbidden("forbidden")
 
@@ -149,9 +110,12 @@ def telegram_webhook(request, secret: str):
 
     try:
         payload = json.loads(request.body.decode("utf-8"))
-        print("[TG webhook] payload:", json.dumps(payload, ensure_ascii=False))
     except Exception:
+        log.warning("telegram_webhook: bad json (%d bytes)", len(request.body))
         return HttpResponse("bad json")
+    log.info("telegram_webhook: update_id=%s", payload.get("update_id"))
+    if log.isEnabledFor(logging.DEBUG) and logs.sampled():
+        log.debug("telegram_webhook: payload=%s", logs.truncate(payload))
 
     msg = payload.get("message") or payload.get("edited_message")
     if not msg:
@@ -171,10 +135,12 @@ def telegram_webhook(request, secret: str):
                 reply = "Похоже, ссылка некорректна. Пожалуйста, вернитесь на сайт и нажмите кнопку заново."
                 return _tg_reply_and_ok(chat_id, reply)
 
-            order = Order.objects.filter(public_token=token).first()
+            order = await Order.objects.filter(public_token=token).afirst()
             if order:
                 order.telegram_chat_id = str(chat_id)
-                order.save(update_fields=["telegram_chat_id", "updated_at"])
+                with logs.bind(order_id=order.pk):
+                    await order.asave(update_fields=["telegram_chat_id", "updated_at"])
+                    log.info("telegram_webhook: chat linked via /start")
                 reply = (
                     "Готово! Мы привязали этот чат к вашей заявке.\n"
                     "Будем присылать обновления статуса."
@@ -188,15 +154,19 @@ def telegram_webhook(request, secret: str):
 
 
 def _tg_reply_and_ok(chat_id, text):
-    token_bot = getattr(settings, "TELEGRAM_BOT_TOKEN", "")
-    if token_bot and chat_id:
-        url = f"https://api.telegram.org/bot{token_bot}/sendMessage"
-        data = {"chat_id": str(chat_id), "text": text, "parse_mode": "HTML", "disable_web_page_preview": True}
-        try:
-            requests.post(url, data=data, timeout=10)
-        except Exception as e:
-            print("[TG webhook] reply failed:", e)
-    return HttpResponse("ok")
+    """
+    Отвечаем прямо в теле ответа на webhook (Telegram сам выполнит sendMessage):
+    воркер не ждёт исходящий запрос к api.telegram.org.
+    """
+    if not chat_id:
+        return HttpResponse("ok")
+    return JsonResponse({
+        "method": "sendMessage",
+        "chat_id": chat_id,
+        "text": text,
+        "parse_mode": "HTML",
+        "disable_web_page_preview": True,
+    })
 
 
 @csrf_exempt
@@ -223,6 +193,41 @@ def save_chat_id(request):
         return JsonResponse({"error": "Order not found"}, status=404)
 
 
+def _link_chat_queryset(order_id, phone, email):
+    """Заказы-кандидаты для привязки чата; None — не хватает данных для поиска."""
+    if order_id:
+        return Order.objects.filter(id=order_id)
+    filters = []
+    digits = normalize_phone(phone)
+    if digits:
+        f = Q(phone_digits=digits)
+        if getattr(settings, "LINK_CHAT_PARTIAL_PHONE", False) and len(digits) >= 7:
+            # частичное совпадение; на PostgreSQL его держит триграммный GIN-индекс
+            f |= Q(phone_digits__contains=digits)
+        filters.append(f)
+    if email:
+        filters.append(Q(email_lower=normalize_email(email)))
+    if not filters:
+        return None
+    q = Order.objects.filter(filters.pop())
+    for f in filters:
+        q = q | Order.objects.filter(f)
+    return q
+
+
+def _welcome_key(order, chat_id) -> str:
+    return f"notify:order:{order.pk}:welcome:{chat_id}"
+
+
+def _link_order_chat(order, chat_id):
+    """Привязать чат к заказу и поставить приветствие в очередь одной транзакцией."""
+    order.telegram_chat_id = str(chat_id)
+    with transaction.atomic():
+        order.save(update_fields=["telegram_chat_id"])
+        # приветствие уходит через очередь уведомлений, ответ боту не ждёт Telegram
+        enqueue(_welcome_key(order, chat_id), "tg_welcome", {"order_id": order.pk, "chat_id": str(chat_id)})
+
+
 class LinkChatView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -235,38 +240,69 @@ class LinkChatView(APIView):
         if not s.is_valid():
             return Response(s.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        order_id = s.validated_data.get("order_id")
-        phone = s.validated_data.get("phone")
-        email = s.validated_data.get("email")
         chat_id = s.validated_data["chat_id"]
-
-        if order_id:
-            q = Order.objects.filter(id=order_id)
-        else:
-            filters = []
-            if phone:
-                filters.append(Q(phone__iexact=phone) | Q(phone__icontains=phone))
-            if email:
-                filters.append(Q(email__iexact=email))
-            if not filters:
-                return Response({"error": "order_id or phone/email required"}, status=status.HTTP_400_BAD_REQUEST)
-            q = Order.objects.filter(filters.pop())
-            for f in filters:
-                q = q | Order.objects.filter(f)
+        q = _link_chat_queryset(
+            s.validated_data.get("order_id"), s.validated_data.get("phone"), s.validated_data.get("email")
+        )
+        if q is None:
+            return Response({"error": "order_id or phone/email required"}, status=status.HTTP_400_BAD_REQUEST)
 
         order = q.order_by("-created_at").first()
         if not order:
             return Response({"error": "order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        order.telegram_chat_id = str(chat_id)
-        order.save(update_fields=["telegram_chat_id"])
-        send_welcome(order)
+        with logs.bind(order_id=order.pk):
+            _link_order_chat(order, chat_id)
+            log.info("link_chat: chat linked")
         return Response({"success": True, "order_id": order.id})
 
+
+@csrf_exempt
+async def link_chat(request):
+    """
+    Async-версия LinkChatView для ASGI-режима (settings.ASYNC_VIEWS):
+    тот же контракт, но без DRF, который не умеет async-представления.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+    if request.headers.get("X-TG-TOKEN") != getattr(settings, "TELEGRAM_SHARED_TOKEN", ""):
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error"}, status=400)
+    else:
+        data = request.POST
+
+    s = LinkChatSerializer(data=data)
+    if not s.is_valid():
+        return JsonResponse(s.errors, status=400)
+
+    chat_id = s.validated_data["chat_id"]
+    q = _link_chat_queryset(
+        s.validated_data.get("order_id"), s.validated_data.get("phone"), s.validated_data.get("email")
+    )
+    if q is None:
+        return JsonResponse({"error": "order_id or phone/email required"}, status=400)
+
+    order = await q.order_by("-created_at").afirst()
+    if not order:
+        return JsonResponse({"error": "order not found"}, status=404)
+
+    with logs.bind(order_id=order.pk):
+        await sync_to_async(_link_order_chat)(order, chat_id)
+        log.info("link_chat: chat linked")
+    return JsonResponse({"success": True, "order_id": order.id})
+
+@cached_page
 def yandex_verify(request):
     return render(request, "core/yandex_d9211e0eacffb670.html")
 
 
+@cached_page
 def concept(request):
     base_url = getattr(settings, "SITE_URL", None) or request.build_absolute_uri('/').rstrip('/')
 
@@ -305,36 +341,39 @@ def concept(request):
 
 
 def station(request, code: str):
-    code = code.lower()
-    data = STATIONS.get(code)
-    if not data:
-        raise Http404("Station not found")
-
-    canonical = request.build_absolute_uri(reverse("station", args=[code]))
-
-    # SEO
-    h1 = f"Доставка багажа {data['name_prep']} — Drop & Delivery"
-    meta_title = f"Доставка багажа {data['name_prep']} / {data['name_gen']} — Drop & Delivery"
-    meta_desc = (
-        f"Заберём багаж у двери и доставим {data['name_prep']} или заберём {data['name_gen']} "
-        f"и привезём по адресу. Пломба, фотофиксация, акт, 1 ночь хранения включена."
-    )
-
-    # Перелинковка: другие вокзалы + аэропорты
-    nav_items = [(reverse("station", args=[k]), f"Вокзал: {v['title']}") for k, v in STATIONS.items() if k != code]
-    nav_items += [(reverse("aero", args=[k]), f"Аэропорт: {v['title']}") for k, v in AEROPORTS.items()]
-
-    ctx = {
-        "code": code,
-        "data": data,
-        "h1": h1,
-        "meta_title": meta_title,
-        "meta_desc": meta_desc,
-        "canonical": canonical,
-        "nav_items": nav_items,
-    }
-    return render(request, "core/hub.html", ctx)
+    return render_hub(request, "station", code)
 
 
+@cached_page
 def kamera_hraneniya_bagazha_moskva(request):
     return render(request, "core/kamera_hraneniya_bagazha_moskva.html")
+
+
+def _sitemap_response(request, gzipped: bool):
+    xml, gz, etag = get_sitemap()
+    # .xml.gz отдаём как файл; обычный sitemap.xml — сжатым, если клиент умеет gzip
+    encode = not gzipped and "gzip" in request.headers.get("Accept-Encoding", "")
+    body = gz if gzipped or encode else xml
+    content_type = "application/x-gzip" if gzipped else "application/xml"
+    response = conditional_page(request, body, content_type, etag, deploy_version()[1])
+    if encode:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def sitemap_xml(request):
+    return _sitemap_response(request, gzipped=False)
+
+
+def sitemap_xml_gz(request):
+    return _sitemap_response(request, gzipped=True)
+
+
+def metrics(request):
+    if getattr(settings, "PERF_METRICS_TOKEN", ""):
+        if not perf.has_token(request):
+            return HttpResponseForbidden("forbidden")
+    elif not settings.DEBUG:
+        raise Http404()
+    return HttpResponse(perf.render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
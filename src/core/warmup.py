@@ -0,0 +1,120 @@
+"""
+Прогрев процесса перед первыми запросами.
+
+gunicorn (gunicorn.conf.py) вызывает run() в мастере после preload_app — импорты,
+шаблоны, URL и кэши уровня процесса достаются воркерам через fork уже готовыми, —
+и run(["db"]) в каждом воркере: соединение с БД через fork не передаётся.
+Без preload всё делается в воркере. Время по фазам пишется в лог.
+"""
+import importlib
+import logging
+import time
+from typing import Dict, Iterable, List, Optional
+
+log = logging.getLogger(__name__)
+
+# Тяжёлые зависимости, которые иначе импортируются на первом запросе
+MODULES = (
+    "rest_framework.views",
+    "rest_framework.response",
+    "requests",
+    "anymail.backends.sendgrid",
+    "core.views",
+    "core.admin",
+)
+# Шаблоны горячих страниц; extends/include компилируются при первом рендере, поэтому base — отдельно
+TEMPLATES = (
+    "core/base.html",
+    "core/index.html",
+    "core/hub.html",
+    "core/order_form.html",
+    "core/order_success.html",
+)
+
+
+def _imports():
+    for name in MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            log.warning("warmup: import %s failed: %s", name, e)
+
+
+def _urls():
+    from django.urls import NoReverseMatch, get_resolver, resolve, reverse
+
+    resolver = get_resolver()
+    for name in [k for k in resolver.reverse_dict if isinstance(k, str)]:
+        try:
+            path = reverse(name)
+        except NoReverseMatch:
+            # маршруты с аргументами (хабы) прогреваются в _caches через hubs.warm()
+            continue
+        resolve(path)
+
+
+def _templates():
+    from django.template.loader import get_template
+
+    for name in TEMPLATES:
+        get_template(name)
+
+
+def _caches():
+    from .critical import FAMILIES, critical_css
+    from .hubs import warm
+    from .pagecache import deploy_version
+    from .storage import images_manifest
+
+    warm()
+    deploy_version()
+    images_manifest()
+    for family in FAMILIES:
+        critical_css(family)
+
+
+def _db():
+    from django.db import connections
+
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+PHASES = {
+    "imports": _imports,
+    "urls": _urls,
+    "templates": _templates,
+    "caches": _caches,
+    "db": _db,
+}
+
+
+def worker_phases(preloaded: bool, asgi: bool) -> List[str]:
+    """
+    Фазы для воркера после fork: при preload мастер уже прогрел всё, кроме БД.
+    Под ASGI ORM ходит в БД из потока sync_to_async — соединение главного потока ему не поможет.
+    """
+    phases = [p for p in PHASES if not preloaded or p == "db"]
+    if asgi:
+        phases.remove("db")
+    return phases
+
+
+def run(phases: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Выполнить фазы прогрева (по умолчанию все); вернуть время каждой в секундах."""
+    timings: Dict[str, float] = {}
+    # пустой список — «ничего не греть», а не «всё»
+    for name in PHASES if phases is None else phases:
+        started = time.perf_counter()
+        try:
+            PHASES[name]()
+        except Exception:
+            # прогрев не должен ронять воркер: что не прогрелось — догреется на первом запросе
+            log.exception("warmup: phase %s failed", name)
+        timings[name] = time.perf_counter() - started
+    log.info(
+        "warmup: %s total=%.0fms",
+        " ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items()),
+        sum(timings.values()) * 1000,
+    )
+    return timings
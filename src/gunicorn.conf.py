@@ -0,0 +1,42 @@
+"""
+Конфиг gunicorn; подхватывается автоматически из текущего каталога (cd src && gunicorn).
+
+DJANGO_ASYNC_VIEWS=True — ASGI-режим: uvicorn-воркеры поверх dandd.asgi,
+async-представления (webhook, link_chat, order_create) не занимают воркер на время I/O.
+
+GUNICORN_PRELOAD=True (по умолчанию) — приложение импортируется и прогревается
+(core.warmup) один раз в мастере, воркеры получают его через fork; в воркере
+остаётся только открыть соединение с БД. Поток логов перезапускается в дочернем
+процессе сам (core.logs).
+"""
+import os
+
+ASGI = os.getenv("DJANGO_ASYNC_VIEWS", "False") == "True"
+
+wsgi_app = "dandd.asgi:application" if ASGI else "dandd.wsgi:application"
+worker_class = "uvicorn_worker.UvicornWorker" if ASGI else "sync"
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+timeout = 120
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+
+def when_ready(server):
+    # мастер: приложение уже загружено (preload_app), греем всё, кроме БД
+    if preload_app:
+        from django.db import connections
+
+        from core import warmup
+
+        warmup.run([p for p in warmup.PHASES if p != "db"])
+        # соединение, открытое при импорте, не должно достаться воркерам через fork
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    from core import warmup
+
+    phases = warmup.worker_phases(preload_app, ASGI)
+    if phases:
+        warmup.run(phases)